@@ -20,6 +20,15 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'users'), exist_ok=True)
 CORS(app, resources={r"/api/*": {"origins": "*"}})  # Configure for production
 jwt = JWTManager(app)
 
+from database import init_app
+import metrics
+import view_counter
+import reconcile
+init_app(app)
+metrics.init_app(app)
+view_counter.init_app(app)
+reconcile.start_background()
+
 # Import routes
 from routes.auth import auth_bp
 from routes.users import users_bp
@@ -32,6 +41,7 @@ from routes.reviews import reviews_bp
 from routes.followers import followers_bp
 from routes.notifications import notifications_bp
 from routes.analytics import analytics_bp
+from routes.maps import maps_bp
 
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(users_bp, url_prefix='/api/users')
@@ -44,11 +54,16 @@ app.register_blueprint(reviews_bp, url_prefix='/api/reviews')
 app.register_blueprint(followers_bp, url_prefix='/api/followers')
 app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
 app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+app.register_blueprint(maps_bp, url_prefix='/api/map')
 
 @app.route('/api/health')
 def health():
     return {'status': 'ok', 'message': 'ShopLink API is running'}
 
+@app.route('/api/metrics')
+def prometheus_metrics():
+    return metrics.metrics_response()
+
 # Serve uploaded files
 @app.route('/api/uploads/shops/<filename>')
 def uploaded_shop_file(filename):
@@ -0,0 +1,121 @@
+"""
+Shop ownership checks for mutating routes.
+
+Nearly every write first asks who owns a shop, and for product routes
+which shop a product belongs to. Both mappings practically never change,
+so they are cached per request (flask.g) and per worker (VersionedCache),
+and a check on the hot path runs no queries. Entries are stamped with an
+ownership epoch, the 'ownership' row of cache_versions, which migration
+0015 bumps whenever a shop changes owner, a product moves shop or either
+is deleted. Each worker rereads the epoch at most every
+AUTHZ_EPOCH_SECONDS, so such a change reaches all workers within that
+interval; invalidate() makes the current worker see it at once.
+Missing rows are never cached, since a later insert does not bump the
+epoch.
+"""
+import functools
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+
+from cache import VersionedCache, current_version
+from database import get_db
+from utils import standard_response
+
+AUTHZ_EPOCH_SECONDS = float(os.getenv('AUTHZ_EPOCH_SECONDS', 1))
+
+shop_owners = VersionedCache('shop_owner')
+product_shops = VersionedCache('product_shop')
+
+_lock = threading.Lock()
+_epoch = None
+_epoch_checked = 0.0
+
+def _current_epoch(cursor):
+    global _epoch, _epoch_checked
+    with _lock:
+        if _epoch is not None and time.monotonic() - _epoch_checked < AUTHZ_EPOCH_SECONDS:
+            return _epoch
+    epoch = current_version(cursor, 'ownership')
+    with _lock:
+        _epoch, _epoch_checked = epoch, time.monotonic()
+    return epoch
+
+def invalidate():
+    """Reread the ownership epoch on the next check in this worker"""
+    global _epoch
+    with _lock:
+        _epoch = None
+
+def _lookup(cursor, cache, name, key, query):
+    try:
+        key = int(key)
+    except (TypeError, ValueError):
+        return None
+    scoped = g.setdefault(name, {})
+    if key in scoped:
+        return scoped[key]
+    epoch = _current_epoch(cursor)
+    value = cache.get(key, epoch)
+    if value is None:
+        cursor.execute(query, (key,))
+        row = cursor.fetchone()
+        value = row[0] if row else None
+        if value is not None:
+            cache.set(key, epoch, value)
+    scoped[key] = value
+    return value
+
+def shop_owner(cursor, shop_id):
+    """owner_id of a shop, or None if it does not exist"""
+    return _lookup(cursor, shop_owners, '_authz_shop_owners', shop_id,
+                   'SELECT owner_id FROM shops WHERE id = ?')
+
+def product_shop(cursor, product_id):
+    """shop_id of a product, or None if it does not exist"""
+    return _lookup(cursor, product_shops, '_authz_product_shops', product_id,
+                   'SELECT shop_id FROM products WHERE id = ?')
+
+def owns_shop(cursor, shop_id, user_id):
+    owner = shop_owner(cursor, shop_id)
+    return owner is not None and owner == user_id
+
+def require_shop_owner(shop_arg='shop_id', product_arg=None, json_field=None,
+                       forbidden='Unauthorized', not_found=None):
+    """Reject the request unless the JWT user owns the shop it targets; place under @jwt_required().
+
+    The shop id is taken from the ``shop_arg`` URL parameter, or the shop of
+    the product in ``product_arg`` (404 'Product not found' if it does not
+    exist), or the ``json_field`` of the request body, where a missing value
+    is left for the view to validate. A missing shop answers 404 with
+    ``not_found`` if given, else 403 with ``forbidden`` like a foreign one.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                cursor = get_db().cursor()
+                if product_arg:
+                    shop_id = product_shop(cursor, kwargs[product_arg])
+                    if shop_id is None:
+                        return jsonify(standard_response('error', 'Product not found')), 404
+                elif json_field:
+                    shop_id = (request.get_json(silent=True) or {}).get(json_field)
+                    if not shop_id:
+                        return view(*args, **kwargs)
+                else:
+                    shop_id = kwargs[shop_arg]
+                owner = shop_owner(cursor, shop_id)
+            except Exception as e:
+                return jsonify(standard_response('error', str(e))), 500
+            
+            if owner is None and not_found:
+                return jsonify(standard_response('error', not_found)), 404
+            if owner is None or owner != int(get_jwt_identity()):
+                return jsonify(standard_response('error', forbidden)), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+"""
+In-process caches for rarely changing rows.
+
+Each gunicorn worker keeps its own bounded LRU of serialized payloads.
+Entries are stamped with a version from the cache_versions table
+(migrations 0012 and 0013), which triggers bump in the same transaction
+as every change to the cached rows, including the counter triggers no
+route code sees. A read costs one primary-key lookup of the current version; the
+entry is served only if its stamp matches, so a write in any worker is
+visible to every other worker on its next request. Entries also expire
+after CACHE_TTL_SECONDS so cold ones do not linger.
+
+Read the version *before* the row on a miss: a write committed between
+the two reads then leaves the entry stamped with the older version, and
+the next request refetches it instead of serving stale data.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2048))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', 300))
+CATALOG_CACHE_MAX_BYTES = int(os.getenv('CATALOG_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+_caches = []
+
+def current_stamp(cursor, key):
+    """(version, changed_at) of ``key`` in cache_versions; (0, None) if it has no row yet"""
+    cursor.execute('SELECT version, changed_at FROM cache_versions WHERE key = ?', (key,))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0, None)
+
+def current_version(cursor, key):
+    """Version stamp of ``key`` in cache_versions"""
+    return current_stamp(cursor, key)[0]
+
+class VersionedCache:
+    """Bounded LRU of (version, expiry, value, size) entries.
+
+    ``max_bytes`` additionally bounds the summed ``size`` passed to set(),
+    for caches holding serialized payloads of very different lengths.
+    """
+
+    def __init__(self, name, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _caches.append(self)
+
+    def _pop(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def get(self, key, version):
+        """Cached value of ``key`` if it was stored at ``version`` and has not expired, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, version, value, size=0):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][3]
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+def all_caches():
+    return list(_caches)
+
+shop_cache = VersionedCache('shop')
+# Pages of a shop's catalog as pre-serialized JSON, keyed by shop, page size and cursor
+catalog_cache = VersionedCache('catalog', max_bytes=CATALOG_CACHE_MAX_BYTES)
+
+def shop_key(shop_id):
+    return f'shop:{shop_id}'
+
+def catalog_key(shop_id):
+    return f'catalog:{shop_id}'
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Query plan check.
+Drives every route through the Flask test client against a freshly
+migrated scratch database, captures the statements the handlers actually
+run (database.capture_statements) and runs EXPLAIN QUERY PLAN for each of
+them with the parameters they were run with. Exits non-zero when a
+statement does a full table scan or sorts through a temp B-tree, when a
+request in EXERCISE fails, or when a route is missing from EXERCISE.
+
+Run it as a script: it imports the app, whose pools and writer thread
+point at the scratch database until the process exits.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import database
+from utils import encode_cursor
+
+OWNER = 'owner@example.com'
+BUYER = 'buyer@example.com'
+PASSWORD = 'plan-check'
+LATEST = encode_cursor('2999-01-01 00:00:00', 1 << 31)
+
+# (method, path, user, json body), run in order on an empty database, so
+# ids are predictable. Cursors point past the first rows so the keyset
+# condition is part of the statement.
+EXERCISE = [
+    ('POST', '/api/auth/signup', None, {'email': OWNER, 'password': PASSWORD, 'full_name': 'Owner'}),
+    ('POST', '/api/auth/signup', None, {'email': BUYER, 'password': PASSWORD, 'full_name': 'Buyer'}),
+    ('POST', '/api/auth/login', None, {'email': OWNER, 'password': PASSWORD}),
+    ('GET', '/api/auth/me', OWNER, None),
+    ('GET', '/api/users/profile', OWNER, None),
+    ('PUT', '/api/users/profile', OWNER, {'city': 'Berlin'}),
+
+    ('POST', '/api/shops', OWNER, {'name': 'Bakery', 'category': 'food', 'latitude': 52.52, 'longitude': 13.40}),
+    ('POST', '/api/shops', OWNER, {'name': 'Bakery', 'category': 'food', 'latitude': 52.53, 'longitude': 13.41}),
+    ('PUT', '/api/shops/2', OWNER, {'name': 'Corner Bakery', 'description': 'Rye and sourdough'}),
+    ('GET', '/api/shops/1', None, None),
+    ('GET', '/api/shops', None, None),
+    ('GET', '/api/shops?offset=1', None, None),
+    ('GET', f'/api/shops?category=food&cursor={LATEST}', None, None),
+    ('GET', f'/api/shops/nearby?lat=52.52&lng=13.4&category=food&cursor={encode_cursor(0.0, 0)}', None, None),
+    ('GET', '/api/users/shops', OWNER, None),
+    ('GET', f'/api/users/shops?cursor={LATEST}', OWNER, None),
+
+    ('POST', '/api/products', OWNER, {'shop_id': 1, 'name': 'Bread', 'price': 4, 'stock_quantity': 20}),
+    ('POST', '/api/products', OWNER, {'shop_id': 1, 'name': 'Bread', 'price': 5, 'stock_quantity': 20}),
+    ('POST', '/api/products', OWNER, {'shop_id': 2, 'name': 'Rolls', 'price': 1, 'stock_quantity': 50}),
+    ('PUT', '/api/products/2', OWNER, {'name': 'Rye Bread', 'price': 6, 'stock_quantity': 10}),
+    ('GET', '/api/products/1', None, None),
+    ('GET', '/api/products/search?q=bread', None, None),
+    ('GET', f'/api/products/search?q=bread&shop_id=1&min_price=1&max_price=20&in_stock=1'
+            f'&cursor={encode_cursor(-99.0, 0)}', None, None),
+    ('GET', '/api/shops/1/products', None, None),
+    ('GET', f'/api/shops/1/products?cursor={LATEST}', None, None),
+
+    ('POST', '/api/events', OWNER, {'shop_id': 1, 'title': 'Tasting', 'start_date': '2999-01-01 10:00:00',
+                                    'latitude': 52.52, 'longitude': 13.40, 'is_published': 1,
+                                    'status': 'published'}),
+    ('PUT', '/api/events/1', OWNER, {'title': 'Bread Tasting', 'max_attendees': 50}),
+    ('GET', '/api/events/1', None, None),
+    ('GET', '/api/events', None, None),
+    ('GET', '/api/events?offset=1', None, None),
+    ('GET', f"/api/events?status=published&is_published=1&cursor={encode_cursor('1970-01-01 00:00:00', 0)}",
+     None, None),
+    ('GET', f'/api/events/nearby?lat=52.52&lng=13.4&cursor={encode_cursor(0.0, 0)}', None, None),
+    ('POST', '/api/events/1/register', BUYER, None),
+    ('GET', '/api/events/1/registrations', OWNER, None),
+    ('GET', '/api/users/events', OWNER, None),
+    ('GET', f'/api/users/events?cursor={LATEST}', OWNER, None),
+
+    ('POST', '/api/cart', BUYER, {'product_id': 1, 'quantity': 2}),
+    ('PUT', '/api/cart/1', BUYER, {'quantity': 3}),
+    ('POST', '/api/cart', BUYER, {'product_id': 3, 'quantity': 1}),
+    ('DELETE', '/api/cart/3', BUYER, None),
+    ('GET', '/api/cart', BUYER, None),
+    ('POST', '/api/orders/checkout', BUYER, {'shipping_address': 'Main St 1'}),
+    ('POST', '/api/orders', BUYER, {'shop_id': 2, 'items': [{'product_id': 3, 'quantity': 2}]}),
+    ('POST', '/api/cart', BUYER, {'product_id': 3, 'quantity': 1}),
+    ('DELETE', '/api/cart/clear', BUYER, None),
+    ('GET', '/api/orders', BUYER, None),
+    ('GET', '/api/orders?shop_id=1', OWNER, None),
+    ('GET', '/api/orders/1', BUYER, None),
+    ('PUT', '/api/orders/1/status', OWNER, {'status': 'completed'}),
+
+    ('POST', '/api/reviews/shop/1', BUYER, {'rating': 5, 'title': 'Great', 'is_verified_purchase': True}),
+    ('POST', '/api/reviews/product/1', BUYER, {'rating': 4, 'body': 'Crusty'}),
+    ('GET', '/api/reviews/shop/1', None, None),
+    ('GET', '/api/reviews/shop/1?sort=highest', None, None),
+    ('GET', f"/api/reviews/shop/1?sort=lowest&cursor={encode_cursor(0, '1970-01-01 00:00:00', 0)}", None, None),
+    ('GET', f"/api/reviews/shop/1?sort=verified&cursor={encode_cursor(2, '2999-01-01 00:00:00', 1 << 31)}",
+     None, None),
+    ('GET', f'/api/reviews/product/1?cursor={LATEST}', None, None),
+    ('GET', '/api/reviews/product/1?sort=highest', None, None),
+    ('GET', '/api/reviews/shop/1/summary', None, None),
+    ('GET', '/api/reviews/product/1/summary', None, None),
+
+    ('POST', '/api/followers/shop/1', BUYER, None),
+    ('GET', '/api/followers/shop/1/check', BUYER, None),
+    ('GET', '/api/followers/shop/1/followers', OWNER, None),
+    ('DELETE', '/api/followers/shop/1', BUYER, None),
+
+    ('GET', '/api/notifications', BUYER, None),
+    ('GET', '/api/notifications?is_read=0', BUYER, None),
+    ('PUT', '/api/notifications/1/read', BUYER, None),
+    ('PUT', '/api/notifications/read-all', BUYER, None),
+    ('GET', '/api/notifications/unread-count', BUYER, None),
+
+    ('GET', '/api/analytics/sales', OWNER, None),
+    ('GET', '/api/analytics/sales?start_date=2000-01-01&end_date=2999-01-01', OWNER, None),
+    ('GET', '/api/analytics/events', OWNER, None),
+    ('GET', '/api/analytics/events?start_date=2000-01-01&end_date=2999-01-01', OWNER, None),
+    ('GET', '/api/analytics/activity', OWNER, None),
+    ('GET', '/api/analytics/alerts', OWNER, None),
+    ('GET', '/api/analytics/shops/1/daily', OWNER, None),
+    ('GET', '/api/analytics/views?entity_type=product&entity_id=1', OWNER, None),
+    ('GET', '/api/analytics/views?entity_type=event&entity_id=1&granularity=hour', OWNER, None),
+
+    ('GET', '/api/map/clusters?kind=shops&zoom=3&bbox=-170,-80,170,80', None, None),
+    ('GET', '/api/map/clusters?kind=events&zoom=14&bbox=13.3,52.4,13.5,52.6', None, None),
+
+    ('DELETE', '/api/products/2', OWNER, None),
+]
+
+# Routes left out of EXERCISE: no SQL, static files, or uploads, which
+# save files under uploads/ and only run a primary-key UPDATE
+UNCHECKED = {
+    'static', 'health', 'prometheus_metrics', 'uploaded_shop_file', 'uploaded_product_file',
+    'shops.uploaded_file', 'products.uploaded_file',
+    'shops.upload_logo', 'shops.upload_cover', 'products.upload_product_image',
+}
+
+# (endpoint, text in the statement, allowed plan fragments)
+# Allowed fragments are only for steps no index can remove, e.g. ordering
+# by an aggregate that is computed per request.
+ALLOWED = [
+    # Distance is computed per request, so sorting the candidates is expected
+    ('shops.nearby_shops', 'haversine_km', ('VIRTUAL TABLE', 'SCAN candidates', 'USE TEMP B-TREE FOR ORDER BY')),
+    ('events.nearby_events', 'haversine_km', ('VIRTUAL TABLE', 'SCAN candidates', 'USE TEMP B-TREE FOR ORDER BY')),
+    # Ranking has to see every match, so the sort by bm25 is expected
+    ('products.search_products', 'products_fts', ('VIRTUAL TABLE', 'USE TEMP B-TREE FOR ORDER BY')),
+    # Dashboard aggregates group by a date computed per row and rank the groups
+    ('analytics.get_sales_analytics', 'GROUP BY', ('USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR ORDER BY')),
+    ('analytics.get_event_analytics', 'GROUP BY month', ('USE TEMP B-TREE FOR GROUP BY',)),
+    ('analytics.get_alerts', 'GROUP BY date', ('USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR ORDER BY')),
+    ('analytics.get_activity_analytics', 'view_stats_daily d', ('USE TEMP B-TREE FOR GROUP BY',)),
+    ('analytics.get_shop_daily_analytics', 'view_stats_daily d', ('USE TEMP B-TREE FOR GROUP BY',)),
+    # The organizer's events in a created_at window, re-sorted by start date
+    ('analytics.get_event_analytics', 'e.created_at >=', ('USE TEMP B-TREE FOR ORDER BY',)),
+    # Rows gathered from each of the owner's shops are merged by one sort
+    ('analytics.get_alerts', 'ORDER BY stock_quantity', ('USE TEMP B-TREE FOR ORDER BY',)),
+    # geo_levels holds one row per grid level
+    ('maps.get_clusters', 'FROM geo_levels', ('SCAN geo_levels',)),
+]
+
+# Statements with no query plan worth checking
+_UNPLANNED = ('PRAGMA', 'BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT', 'END')
+
+def plan_problems(conn, sql, params, allowed=()):
+    """Return the plan steps of ``sql`` that scan a table or use a temp B-tree"""
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+        detail = row['detail']
+        if any(fragment in detail for fragment in allowed):
+            continue
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            problems.append(detail)
+        elif 'TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+def allowed_fragments(endpoint, sql):
+    return tuple(fragment for allowed_endpoint, text, fragments in ALLOWED
+                 if allowed_endpoint == endpoint and text in sql for fragment in fragments)
+
+def exercise(app):
+    """Send every EXERCISE request through the test client; returns the ones that failed"""
+    client = app.test_client()
+    tokens = {}
+    failures = []
+    for number, (method, path, user, body) in enumerate(EXERCISE):
+        headers = {}
+        if user is not None:
+            if user not in tokens:
+                response = client.post('/api/auth/login', json={'email': user, 'password': PASSWORD})
+                tokens[user] = response.get_json()['data']['access_token']
+            headers['Authorization'] = f'Bearer {tokens[user]}'
+            if method == 'POST':
+                headers['Idempotency-Key'] = f'plan-check-{number}'
+        response = client.open(path, method=method, json=body, headers=headers)
+        if response.status_code >= 400:
+            failures.append(f'{method} {path}: {response.status_code} {response.get_data(as_text=True)[:200]}')
+    return failures
+
+def unexercised_routes(app):
+    """Endpoints registered on the app that no EXERCISE request reaches"""
+    adapter = app.url_map.bind('localhost')
+    reached = {adapter.match(path.split('?')[0], method)[0] for method, path, _, _ in EXERCISE}
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - reached - UNCHECKED)
+
+def check():
+    """Exercise the routes on a scratch database and plan every statement they ran.
+
+    Returns (failures, number of distinct statements checked).
+    """
+    scratch = tempfile.mkdtemp()
+    original_path = database.DB_PATH
+    database.DB_PATH = os.path.join(scratch, 'plans.db')
+    try:
+        database.migrate()
+        from app import app
+        from rollups import run_rollups
+        from view_counter import view_counter
+        from writer import writer
+
+        conn = database.connect()
+        conn.execute("INSERT INTO notifications (user_id, type, message) VALUES (2, 'order', 'Order placed')")
+        conn.commit()
+
+        # Buffered view counts and rollups run as writer jobs outside any request
+        with database.capture_statements() as statements:
+            failures = exercise(app)
+            view_counter.flush(wait=True)
+            run_rollups()
+        writer.close()
+        failures += [f'{endpoint}: not in EXERCISE' for endpoint in unexercised_routes(app)]
+
+        checked = set()
+        for endpoint, sql, params in statements:
+            if (endpoint, sql) in checked or sql.split(None, 1)[0].upper() in _UNPLANNED:
+                continue
+            checked.add((endpoint, sql))
+            problems = plan_problems(conn, sql, params, allowed_fragments(endpoint, sql))
+            if problems:
+                failures.append(f"{endpoint}: {'; '.join(problems)} in {database.normalize_sql(sql)}")
+        conn.discard()
+        return failures, len(checked)
+    finally:
+        database.DB_PATH = original_path
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == '__main__':
+    failures, checked = check()
+    for failure in failures:
+        print(failure)
+    if failures:
+        print(f'{len(failures)} problem(s) across {checked} route statements')
+        sys.exit(1)
+    print(f'All {checked} route statements use indexes')
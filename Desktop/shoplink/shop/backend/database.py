@@ -1,320 +1,735 @@
 import sqlite3
 import os
-from datetime import datetime
+import queue
+import threading
+import functools
+import importlib.util
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from flask import current_app, g, has_app_context, has_request_context, request
+
+import geo
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'shoplink.db')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Connection tuning (override through the environment)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 16 * 1024))
+
+# Query instrumentation
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG')  # file path; defaults to the app log
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+
+# Opt-in query result cache (cached_query); 0 bytes disables it
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv('QUERY_CACHE_TTL_SECONDS', 5))
+
+slow_query_logger = logging.getLogger('shoplink.slow_queries')
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equal statements group together"""
+    sql = ' '.join(sql.split())
+    sql = _LITERAL_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+_stats_lock = threading.Lock()
+_endpoint_stats = {}
+
+class QueryScope:
+    """Statements issued on behalf of one request or one writer job"""
+    __slots__ = ('endpoint', 'count', 'time', 'statements')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def merge(self, other):
+        self.count += other.count
+        self.time += other.time
+        self.statements.update(other.statements)
+
+_job_scope = threading.local()
+
+def _current_scope():
+    scope = getattr(_job_scope, 'scope', None)
+    if scope is not None:
+        return scope
+    if has_app_context():
+        scope = g.get('_query_scope')
+        if scope is None:
+            endpoint = (request.endpoint or '<unmatched>') if has_request_context() else None
+            scope = g._query_scope = QueryScope(endpoint)
+        return scope
+    return None
+
+@contextmanager
+def query_scope(endpoint):
+    """Attribute statements run on this thread to ``endpoint`` (used by writer jobs)"""
+    scope = QueryScope(endpoint)
+    _job_scope.scope = scope
+    try:
+        yield scope
+    finally:
+        _job_scope.scope = None
+
+def merge_query_scope(scope):
+    """Fold a finished writer job's statements into the current request"""
+    current = _current_scope()
+    if current is not None and scope is not None:
+        current.merge(scope)
+
+class QueryRecord:
+    __slots__ = ('sql', 'endpoint', 'duration', 'rows', 'logged', 'scope')
+
+    def __init__(self, sql, endpoint, scope):
+        self.sql = sql
+        self.endpoint = endpoint
+        self.duration = 0.0
+        self.rows = 0
+        self.logged = False
+        self.scope = scope
+
+def _start_query(sql):
+    scope = _current_scope()
+    endpoint = scope.endpoint if scope is not None and scope.endpoint else threading.current_thread().name
+    record = QueryRecord(normalize_sql(sql), endpoint, scope)
+    if scope is not None:
+        scope.count += 1
+        scope.statements[record.sql] += 1
+    with _stats_lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = _endpoint_stats[endpoint] = {
+                'requests': 0, 'queries': 0, 'rows': 0, 'time_ms': 0.0, 'slow_queries': 0}
+        stats['queries'] += 1
+    return record
+
+_captured = None
+
+@contextmanager
+def capture_statements():
+    """Collect (endpoint, sql, parameters) of every statement run while active (check_query_plans.py)"""
+    global _captured
+    _captured = []
+    try:
+        yield _captured
+    finally:
+        _captured = None
+
+def _finish_query(record, elapsed, rows=0):
+    record.duration += elapsed
+    record.rows += rows
+    if record.scope is not None:
+        record.scope.time += elapsed
+    slow = not record.logged and record.duration * 1000 >= SLOW_QUERY_MS
+    with _stats_lock:
+        stats = _endpoint_stats[record.endpoint]
+        stats['rows'] += rows
+        stats['time_ms'] += elapsed * 1000
+        if slow:
+            stats['slow_queries'] += 1
+    if slow:
+        record.logged = True
+        slow_query_logger.warning('%.1fms rows=%d endpoint=%s sql=%s',
+                                  record.duration * 1000, record.rows, record.endpoint, record.sql)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement and counts the rows fetched from it"""
+
+    _record = None
+
+    def execute(self, sql, parameters=()):
+        self._record = _start_query(sql)
+        if _captured is not None:
+            _captured.append((self._record.endpoint, sql, parameters))
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        finally:
+            _finish_query(self._record, time.perf_counter() - started)
+        query_cache.track(self.connection, sql, parameters)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._record = _start_query(sql)
+        started = time.perf_counter()
+        seq_of_parameters = list(seq_of_parameters)
+        if _captured is not None and seq_of_parameters:
+            _captured.append((self._record.endpoint, sql, seq_of_parameters[0]))
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        finally:
+            _finish_query(self._record, time.perf_counter() - started)
+        if seq_of_parameters:
+            query_cache.track(self.connection, sql, seq_of_parameters[0])
+        return result
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._record is not None:
+            _finish_query(self._record, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._record is not None:
+            _finish_query(self._record, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._record is not None:
+            _finish_query(self._record, time.perf_counter() - started, len(rows))
+        return rows
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that goes back to its pool instead of closing.
+
+    Handlers still call ``conn.close()`` when they are done; inside a request
+    that only rolls back uncommitted work, and the connection is returned to
+    the pool by the app-context teardown.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.in_app_context = False
+        # Tables written in the open transaction, invalidated in query_cache once it ends
+        self.written_tables = set()
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        if self.in_app_context:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Really close the underlying sqlite handle"""
+        sqlite3.Connection.close(self)
+
+    def commit(self):
+        super().commit()
+        query_cache.track(self)
+
+    def rollback(self):
+        super().rollback()
+        query_cache.track(self)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _configure(conn):
+    """Apply per-connection pragmas once, when the connection is created"""
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    geo.register(conn)
     return conn
 
-def init_db():
-    """Initialize database with all tables"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            full_name TEXT,
-            phone TEXT,
-            profile_photo TEXT,
-            bio TEXT,
-            address TEXT,
-            city TEXT,
-            state TEXT,
-            country TEXT,
-            is_verified INTEGER DEFAULT 0,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Shops table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shops (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            owner_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            slug TEXT UNIQUE,
-            category TEXT,
-            description TEXT,
-            logo_url TEXT,
-            cover_photo_url TEXT,
-            location TEXT,
-            address TEXT,
-            city TEXT,
-            state TEXT,
-            country TEXT,
-            latitude REAL,
-            longitude REAL,
-            phone TEXT,
-            email TEXT,
-            website TEXT,
-            business_hours TEXT,
-            rating REAL DEFAULT 0,
-            reviews_count INTEGER DEFAULT 0,
-            followers_count INTEGER DEFAULT 0,
-            product_count INTEGER DEFAULT 0,
-            total_sales INTEGER DEFAULT 0,
-            is_verified INTEGER DEFAULT 0,
-            is_online_selling INTEGER DEFAULT 1,
-            is_offline_selling INTEGER DEFAULT 0,
-            accepts_online_payment INTEGER DEFAULT 1,
-            accepts_cash INTEGER DEFAULT 1,
-            is_active INTEGER DEFAULT 1,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (owner_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Products table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            shop_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            slug TEXT,
-            description TEXT,
-            price REAL NOT NULL,
-            original_price REAL,
-            discount_percentage REAL,
-            image_url TEXT,
-            stock_quantity INTEGER DEFAULT 0,
-            min_order_quantity INTEGER DEFAULT 1,
-            max_order_quantity INTEGER,
-            sku TEXT,
-            barcode TEXT,
-            weight REAL,
-            dimensions TEXT,
-            category TEXT,
-            tags TEXT,
-            rating REAL DEFAULT 0,
-            reviews_count INTEGER DEFAULT 0,
-            views_count INTEGER DEFAULT 0,
-            sales_count INTEGER DEFAULT 0,
-            is_available INTEGER DEFAULT 1,
-            is_in_stock INTEGER DEFAULT 1,
-            is_featured INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (shop_id) REFERENCES shops(id)
-        )
-    ''')
-    
-    # Product photos table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS product_photos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            shop_id INTEGER NOT NULL,
-            url TEXT NOT NULL,
-            is_primary INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (product_id) REFERENCES products(id),
-            FOREIGN KEY (shop_id) REFERENCES shops(id)
-        )
-    ''')
-    
-    # Events table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            organizer_id INTEGER NOT NULL,
-            shop_id INTEGER,
-            title TEXT NOT NULL,
-            slug TEXT,
-            description TEXT,
-            event_type TEXT,
-            category TEXT,
-            start_date TEXT NOT NULL,
-            end_date TEXT,
-            location TEXT,
-            venue_name TEXT,
-            venue_address TEXT,
-            venue_city TEXT,
-            venue_state TEXT,
-            venue_country TEXT,
-            latitude REAL,
-            longitude REAL,
-            meeting_url TEXT,
-            max_attendees INTEGER,
-            ticket_price REAL DEFAULT 0,
-            is_free INTEGER DEFAULT 1,
-            is_published INTEGER DEFAULT 0,
-            status TEXT DEFAULT 'draft',
-            views_count INTEGER DEFAULT 0,
-            registrations_count INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (organizer_id) REFERENCES users(id),
-            FOREIGN KEY (shop_id) REFERENCES shops(id)
-        )
-    ''')
-    
-    # Event registrations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS event_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            status TEXT DEFAULT 'registered',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (event_id) REFERENCES events(id),
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(event_id, user_id)
-        )
-    ''')
-    
-    # Shop followers table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shop_followers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            shop_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (shop_id) REFERENCES shops(id),
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(shop_id, user_id)
-        )
-    ''')
-    
-    # Shop reviews table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shop_reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            shop_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
-            title TEXT,
-            body TEXT,
-            is_verified_purchase INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (shop_id) REFERENCES shops(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Product reviews table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS product_reviews (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
-            title TEXT,
-            body TEXT,
-            is_verified_purchase INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (product_id) REFERENCES products(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Cart items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS cart_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL DEFAULT 1,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (product_id) REFERENCES products(id),
-            UNIQUE(user_id, product_id)
-        )
-    ''')
-    
-    # Wishlist table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS wishlist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (product_id) REFERENCES products(id),
-            UNIQUE(user_id, product_id)
-        )
-    ''')
-    
-    # Orders table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            shop_id INTEGER NOT NULL,
-            status TEXT DEFAULT 'pending',
-            total_amount REAL NOT NULL,
-            currency TEXT DEFAULT 'USD',
-            payment_method TEXT,
-            shipping_address TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (shop_id) REFERENCES shops(id)
-        )
-    ''')
-    
-    # Order items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            unit_price REAL NOT NULL,
-            subtotal REAL NOT NULL,
-            FOREIGN KEY (order_id) REFERENCES orders(id),
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    ''')
-    
-    # Payments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            provider TEXT,
-            reference TEXT,
-            amount REAL NOT NULL,
-            currency TEXT DEFAULT 'USD',
-            status TEXT DEFAULT 'pending',
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (order_id) REFERENCES orders(id)
-        )
-    ''')
-    
-    # Notifications table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            message TEXT NOT NULL,
-            is_read INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Create indexes
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_shops_owner ON shops(owner_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_shop ON products(shop_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_organizer ON events(organizer_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_shop ON events(shop_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cart_user ON cart_items(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_shop ON orders(shop_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)')
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully!")
+def connect():
+    """Open a new tuned connection that is not attached to any pool"""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False, factory=PooledConnection)
+    return _configure(conn)
+
+def connect_read_only():
+    """Open a new read-only connection (mode=ro, query_only) for GET routes"""
+    uri = Path(DB_PATH).resolve().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False, factory=PooledConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA query_only = 1')
+    geo.register(conn)
+    return conn
+
+# Statements that never write; anything else is analysed for the tables it writes
+_NON_WRITING = frozenset(('SELECT', 'PRAGMA', 'EXPLAIN', 'BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT', 'END'))
+_READ_ACTIONS = frozenset((sqlite3.SQLITE_READ,))
+_WRITE_ACTIONS = frozenset((sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE))
+_ALL_TABLES = '*'
+
+def _freeze(parameters):
+    if isinstance(parameters, dict):
+        return tuple(sorted(parameters.items()))
+    return tuple(parameters)
+
+def _rows_size(rows):
+    """Rough memory footprint of fetched rows, for the cache's byte budget"""
+    size = 64
+    for row in rows:
+        size += 64 + sum(len(value) if isinstance(value, (str, bytes)) else 16 for value in row)
+    return size
+
+class QueryCache:
+    """Per-process LRU of query results, invalidated by the tables they read.
+
+    ``cached_query`` is opt-in for reads that repeat verbatim within
+    seconds. On a miss the statement is prepared once under an SQLite
+    authorizer (on a private read-only connection, via EXPLAIN) to learn
+    which tables it reads; every statement run through PooledConnection is
+    analysed the same way for the tables it writes, including writes made
+    by triggers, and once its transaction commits (or rolls back) the
+    entries reading those tables are dropped. Each table also carries a
+    generation, so a result fetched while a write was committing is never
+    stored. Writes from other processes are not seen: entries live at most
+    QUERY_CACHE_TTL_SECONDS, and anything that must be current should not
+    use this cache. Results are bounded by QUERY_CACHE_MAX_BYTES.
+    """
 
+    name = 'query'
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES, ttl_seconds=QUERY_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._analysis_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = Counter()
+        self._tables = {}
+        self._analysis_conn = None
+        self._bytes = 0
+        self._used = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                self._reset()
+
+    def _analyse(self, sql, parameters):
+        """(tables read, tables written) by ``sql``, or None if it cannot be analysed"""
+        tables = self._tables.get(sql)
+        if tables is not None or sql in self._tables:
+            return tables
+        with self._analysis_lock:
+            self._read, self._written = set(), set()
+            try:
+                if self._analysis_conn is None:
+                    self._analysis_conn = self._connect_analysis()
+                self._analysis_conn.execute('EXPLAIN ' + sql, parameters).fetchall()
+                tables = (frozenset(self._read), frozenset(self._written))
+            except sqlite3.Error:
+                tables = None
+            if len(self._tables) >= 4096:
+                self._tables.clear()
+            self._tables[sql] = tables
+        return tables
+
+    def _connect_analysis(self):
+        # No statement cache: the authorizer only runs while a statement is prepared
+        uri = Path(DB_PATH).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=0)
+        geo.register(conn)
+        conn.set_authorizer(self._authorize)
+        return conn
+
+    def _authorize(self, action, arg1, arg2, db_name, trigger):
+        if arg1 and not arg1.startswith('sqlite_'):
+            if action in _READ_ACTIONS:
+                self._read.add(arg1)
+            elif action in _WRITE_ACTIONS:
+                self._written.add(arg1)
+        return sqlite3.SQLITE_OK
+
+    def cached_query(self, cursor, sql, parameters=()):
+        """fetchall() of ``sql``, served from the cache while no table it reads has changed"""
+        self._check_fork()
+        if self.max_bytes <= 0:
+            return cursor.execute(sql, parameters).fetchall()
+        key = (sql, _freeze(parameters))
+        now = time.monotonic()
+        with self._lock:
+            self._used = True
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+
+        tables = self._analyse(sql, parameters)
+        if tables is None:
+            return cursor.execute(sql, parameters).fetchall()
+        read = tables[0]
+        with self._lock:
+            generations = self._generation_of(read)
+        rows = cursor.execute(sql, parameters).fetchall()
+        size = _rows_size(rows)
+
+        with self._lock:
+            # Skip the result if a write to its tables committed meanwhile
+            if size <= self.max_bytes and self._generation_of(read) == generations:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (rows, read, now + self.ttl_seconds, size)
+                self._bytes += size
+                for table in read:
+                    self._by_table.setdefault(table, set()).add(key)
+                while self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return rows
+
+    def _generation_of(self, tables):
+        return (self._generations[_ALL_TABLES],) + tuple(self._generations[table] for table in sorted(tables))
+
+    def _remove(self, key):
+        rows, read, expires, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in read:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def track(self, conn, sql=None, parameters=()):
+        """Record what ``sql`` wrote on ``conn``; invalidate it all once no transaction is open"""
+        if not self._used or not isinstance(conn, PooledConnection):
+            return
+        self._check_fork()
+        if sql is not None:
+            words = sql.split(None, 1)
+            if words and words[0].upper() not in _NON_WRITING:
+                tables = self._analyse(sql, parameters)
+                conn.written_tables.update(tables[1] if tables is not None else (_ALL_TABLES,))
+        if conn.written_tables and not conn.in_transaction:
+            self.invalidate(conn.written_tables)
+            conn.written_tables.clear()
+
+    def invalidate(self, tables):
+        """Drop the cached results that read any of ``tables`` ('*' drops everything)"""
+        with self._lock:
+            self.invalidations += 1
+            if _ALL_TABLES in tables:
+                self._generations[_ALL_TABLES] += 1
+                keys = list(self._entries)
+            else:
+                keys = set()
+                for table in tables:
+                    self._generations[table] += 1
+                    keys.update(self._by_table.get(table, ()))
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+query_cache = QueryCache()
+
+def cached_query(cursor, sql, parameters=()):
+    """Opt-in cached fetchall(); see QueryCache for when results may be stale"""
+    return query_cache.cached_query(cursor, sql, parameters)
+
+class ConnectionPool:
+    """Per-process pool of idle, already-configured connections.
+
+    At most ``size`` idle connections are kept; extra connections opened
+    under load are closed when released. The pool resets itself after a
+    fork so gunicorn workers never share a handle with the master.
+    """
+
+    def __init__(self, size, opener):
+        self.size = size
+        self.opener = opener
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            self.in_use += 1
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self.opener()
+            conn.pool = self
+            with self._lock:
+                self.created += 1
+            return conn
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            if self._pid != os.getpid() or conn.pool is not self:
+                return
+            self.in_use -= 1
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.discard()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'in_use': self.in_use,
+            'created': self.created,
+            'reused': self.reused,
+        }
+
+_pool = ConnectionPool(DB_POOL_SIZE, connect)
+_read_pool = ConnectionPool(DB_POOL_SIZE, connect_read_only)
+
+def _acquire(pool, key):
+    if not has_app_context():
+        return pool.acquire()
+    conn = g.get(key)
+    if conn is None:
+        conn = pool.acquire()
+        conn.in_app_context = True
+        setattr(g, key, conn)
+    return conn
+
+def get_db():
+    """Return a pooled connection.
+
+    Inside a Flask app context the same connection is reused for the whole
+    request and released by ``close_db``; elsewhere (scripts, init_db) the
+    caller releases it with ``conn.close()``. Views marked ``@read_only``
+    get the read-only connection instead.
+    """
+    if has_app_context() and g.get('_db_read_only'):
+        return get_read_db()
+    return _acquire(_pool, '_db')
+
+def get_read_db():
+    """Return a pooled read-only connection; any write on it fails immediately"""
+    return _acquire(_read_pool, '_read_db')
+
+def read_only(view):
+    """Declare a route read-only so get_db() inside it uses the read pool"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g._db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def close_db(exc=None):
+    """Teardown hook: roll back leftovers and return connections to their pools"""
+    for key in ('_db', '_read_db'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.in_app_context = False
+            conn.close()
+
+def pool_stats():
+    return {'read_write': _pool.stats(), 'read_only': _read_pool.stats()}
+
+def query_stats():
+    """Per-endpoint query totals since the process started"""
+    with _stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _endpoint_stats.items()}
+
+def request_query_scope():
+    """Statements run so far for the current request (None outside a request)"""
+    return g.get('_query_scope') if has_app_context() else None
+
+def _after_request(response):
+    """Account the request's queries and optionally expose them as headers"""
+    scope = request_query_scope()
+    count = scope.count if scope else 0
+    elapsed_ms = scope.time * 1000 if scope else 0.0
+    endpoint = request.endpoint or '<unmatched>'
+    with _stats_lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is not None:
+            stats['requests'] += 1
+    if scope and scope.statements:
+        sql, repeats = scope.statements.most_common(1)[0]
+        if repeats >= N_PLUS_ONE_THRESHOLD:
+            slow_query_logger.warning('possible N+1: %d executions in %s of sql=%s', repeats, endpoint, sql)
+    if current_app.config.get('QUERY_TIMING_HEADERS'):
+        response.headers['X-Query-Count'] = str(count)
+        response.headers.add('Server-Timing', f'db;dur={elapsed_ms:.2f};desc="{count} queries"')
+    return response
+
+def init_app(app):
+    """Register the database hooks on the Flask app"""
+    app.config.setdefault('QUERY_TIMING_HEADERS', os.getenv('QUERY_TIMING_HEADERS', '0') == '1')
+    if SLOW_QUERY_LOG:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+    app.after_request(_after_request)
+    app.teardown_appcontext(close_db)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+_MIGRATION_RE = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+_INDEX_RE = re.compile(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\b', re.IGNORECASE)
+
+def list_migrations():
+    """Return (version, name, path) for every migration file, in order"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), filename, os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError('Duplicate migration version in ' + MIGRATIONS_DIR)
+    return migrations
+
+def split_statements(sql):
+    """Split a SQL script into complete statements (trigger bodies stay whole)"""
+    statements = []
+    current = ''
+    for line in sql.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statement = '\n'.join(l for l in current.strip().splitlines()
+                                  if not l.strip().startswith('--')).strip()
+            if statement:
+                statements.append(statement)
+            current = ''
+    if current.strip() and any(not l.strip().startswith('--') for l in current.strip().splitlines()):
+        raise ValueError('Incomplete SQL statement at end of migration')
+    return statements
+
+def _run_in_transaction(conn, statements, version=None):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        if version is not None:
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def _apply_sql_migration(conn, version, path):
+    """Apply a .sql migration.
+
+    Consecutive ordinary statements run together in one transaction, while
+    each CREATE INDEX gets a short transaction of its own so the write lock
+    is released between index builds and WAL readers are never blocked for
+    the whole migration. Because a migration can therefore be interrupted
+    part-way, every statement must be idempotent (IF NOT EXISTS etc.).
+    """
+    with open(path) as f:
+        statements = split_statements(f.read())
+    pending = []
+    for statement in statements:
+        if _INDEX_RE.match(statement):
+            if pending:
+                _run_in_transaction(conn, pending)
+                pending = []
+            _run_in_transaction(conn, [statement])
+        else:
+            pending.append(statement)
+    _run_in_transaction(conn, pending, version)
+
+def _apply_py_migration(conn, version, path):
+    """Apply a .py migration: its upgrade(conn) runs in one transaction"""
+    spec = importlib.util.spec_from_file_location(f'migration_{version:04d}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        module.upgrade(conn)
+        conn.execute(f'PRAGMA user_version = {int(version)}')
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+def migrate():
+    """Apply pending migrations; returns the schema version.
+
+    The schema version is kept in PRAGMA user_version, so an up-to-date
+    database costs a single pragma read and no DDL at all.
+    """
+    migrations = list_migrations()
+    latest = migrations[-1][0] if migrations else 0
+    conn = connect()
+    conn.isolation_level = None  # transactions are managed explicitly
+    try:
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        if current >= latest:
+            return current
+        for version, filename, path in migrations:
+            if version <= current:
+                continue
+            if path.endswith('.sql'):
+                _apply_sql_migration(conn, version, path)
+            else:
+                _apply_py_migration(conn, version, path)
+            print(f"Applied migration {filename}")
+            current = version
+        conn.execute('PRAGMA optimize')
+        return current
+    finally:
+        conn.discard()
+
+def init_db():
+    """Bring the database schema up to date"""
+    version = migrate()
+    print(f"Database ready (schema version {version})")
@@ -0,0 +1,103 @@
+"""
+Geo helpers for the "near me" and map cluster endpoints.
+
+Shop and event coordinates are mirrored into R*Tree tables (migration
+0009); a nearby query first asks the R*Tree for the points inside a
+bounding box around the search circle, then refines those candidates with
+the exact great-circle distance from haversine_km, which is registered as a
+SQL function on every connection. The distance is taken from the R*Tree's
+own coordinates, which SQLite stores as 32-bit floats (about 1 m of
+precision), so shop rows are only read for points inside the circle.
+
+Map clusters are read from the geo_cells grid (migration 0010); the
+helpers below pick the grid level for a zoom and the cells in view.
+"""
+import math
+import os
+
+from utils import ApiError
+
+NEARBY_DEFAULT_RADIUS_KM = float(os.getenv('NEARBY_DEFAULT_RADIUS_KM', 5))
+NEARBY_MAX_RADIUS_KM = float(os.getenv('NEARBY_MAX_RADIUS_KM', 50))
+# Map clusters: grid level = zoom + MAP_CLUSTER_DETAIL, coarser if the view would exceed MAP_MAX_CELLS
+MAP_CLUSTER_DETAIL = int(os.getenv('MAP_CLUSTER_DETAIL', 2))
+MAP_MAX_CELLS = int(os.getenv('MAP_MAX_CELLS', 128))
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points, in kilometres"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing the circle around a point.
+
+    Near the poles, or when the circle crosses the antimeridian, the box
+    widens to every longitude; it is only a prefilter, so that stays correct.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6:
+        return min_lat, max_lat, -180.0, 180.0
+    dlng = radius_km / (KM_PER_DEGREE * cos_lat)
+    if lng - dlng < -180 or lng + dlng > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lng - dlng, lng + dlng
+
+def search_args(args):
+    """Parse and validate lat, lng and radius_km from the query string"""
+    try:
+        lat = float(args['lat'])
+        lng = float(args['lng'])
+        radius_km = float(args.get('radius_km', NEARBY_DEFAULT_RADIUS_KM))
+    except KeyError:
+        raise ApiError('lat and lng are required')
+    except ValueError:
+        raise ApiError('lat, lng and radius_km must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ApiError('lat or lng out of range')
+    if not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+        raise ApiError(f'radius_km must be between 0 and {NEARBY_MAX_RADIUS_KM:g}')
+    return lat, lng, radius_km
+
+def bbox_args(args):
+    """Parse bbox=west,south,east,north; west > east means the view crosses the antimeridian"""
+    try:
+        west, south, east, north = (float(value) for value in args.get('bbox', '').split(','))
+    except ValueError:
+        raise ApiError('bbox must be west,south,east,north')
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise ApiError('bbox out of range')
+    return west, south, east, north
+
+def cell_ranges(level, west, south, east, north):
+    """Cell x ranges and the y range covering a bbox on the 2^level grid of migration 0010"""
+    size = 1 << level
+    to_x = lambda lng: min(int((lng + 180) * size / 360), size - 1)
+    to_y = lambda lat: min(int((lat + 90) * size / 180), size - 1)
+    if west <= east:
+        x_ranges = [(to_x(west), to_x(east))]
+    else:
+        x_ranges = [(to_x(west), size - 1), (0, to_x(east))]
+    return x_ranges, (to_y(south), to_y(north))
+
+def cluster_level(levels, zoom, bbox):
+    """Finest stored grid level for a map zoom that keeps the view under MAP_MAX_CELLS cells"""
+    candidates = [level for level in levels if level <= zoom + MAP_CLUSTER_DETAIL] or levels[:1]
+    for level in reversed(candidates):
+        x_ranges, (y0, y1) = cell_ranges(level, *bbox)
+        if sum(x1 - x0 + 1 for x0, x1 in x_ranges) * (y1 - y0 + 1) <= MAP_MAX_CELLS:
+            return level
+    return candidates[0]
+
+def register(conn):
+    """Make haversine_km(lat1, lng1, lat2, lng2) available to SQL on ``conn``"""
+    conn.create_function('haversine_km', 4, haversine_km, deterministic=True)
@@ -0,0 +1,55 @@
+"""
+HTTP conditional GET for shop, catalog, product and event responses.
+
+Validators come from cache_versions (migrations 0012-0014): the ETag is
+the resource's version stamp and Last-Modified the time of its latest
+change, both set by triggers in the same transaction as the change. A
+handler reads the stamp first, one primary-key lookup, and answers 304
+without a body before touching the resource rows when the client's copy
+is current. If-None-Match takes precedence over If-Modified-Since.
+
+Cache-Control is chosen per kind of response: versioned resources are
+public but always revalidated, since a 304 is cheap and edits must show
+up at once; public lists without validators may be reused briefly.
+"""
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, request
+
+HTTP_LIST_MAX_AGE = int(os.getenv('HTTP_LIST_MAX_AGE', 30))
+
+CACHE_CONTROL = {
+    'resource': 'public, no-cache',
+    'list': f'public, max-age={HTTP_LIST_MAX_AGE}',
+}
+
+def validators(tag, version, changed_at):
+    """(etag, last_modified) for a cache_versions stamp; ``tag`` names the resource"""
+    last_modified = None
+    if changed_at:
+        last_modified = datetime.strptime(changed_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return f'{tag}-{version}', last_modified
+
+def is_fresh(etag, last_modified):
+    """Whether the request's conditional headers match the current validators"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def with_validators(response, etag, last_modified, policy='resource'):
+    """Attach ETag, Last-Modified and Cache-Control to ``response``"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return with_policy(response, policy)
+
+def with_policy(response, policy):
+    response.headers['Cache-Control'] = CACHE_CONTROL[policy]
+    return response
+
+def not_modified(etag, last_modified, policy='resource'):
+    """Empty 304 response carrying the validators"""
+    return with_validators(current_app.response_class(status=304), etag, last_modified, policy)
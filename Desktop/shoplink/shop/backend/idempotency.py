@@ -0,0 +1,161 @@
+"""
+Idempotency-Key support for POST mutations.
+
+A request carrying an ``Idempotency-Key`` header claims that key for the user
+before the view runs, and the view's response is stored against it. A retry
+with the same key and body is answered from the stored response on a
+read-only connection, without re-running the view or taking the write lock.
+Reusing a key for a different request is rejected with 422, and a retry that
+arrives while the first request is still running gets 409. Keys expire after
+IDEMPOTENCY_TTL_SECONDS.
+"""
+import functools
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from database import get_read_db
+from utils import standard_response
+from writer import writer
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+# A claim without a stored response older than this is treated as abandoned
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+IDEMPOTENCY_PURGE_SECONDS = int(os.getenv('IDEMPOTENCY_PURGE_SECONDS', 300))
+MAX_KEY_LENGTH = 255
+
+HEADER = 'Idempotency-Key'
+
+_last_purge = 0.0
+
+logger = logging.getLogger(__name__)
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _lookup(user_id, key):
+    """Read the live record for a key, or None (read pool, never blocks on writers)"""
+    conn = get_read_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT endpoint, request_hash, status_code, response_body,
+               created_at <= datetime('now', ?) as abandoned
+        FROM idempotency_keys
+        WHERE user_id = ? AND idempotency_key = ? AND expires_at > datetime('now')
+    ''', (f'-{IDEMPOTENCY_LOCK_SECONDS} seconds', user_id, key))
+    record = cursor.fetchone()
+    conn.close()
+    if record is not None and record['status_code'] is None and record['abandoned']:
+        return None
+    return record
+
+def _claim(conn, user_id, key, endpoint, request_hash):
+    """Insert an in-progress record; returns the existing record if the key is taken"""
+    global _last_purge
+    cursor = conn.cursor()
+    
+    # Clear expired keys now and then, plus an expired or abandoned claim on this key
+    now = time.monotonic()
+    if now - _last_purge >= IDEMPOTENCY_PURGE_SECONDS:
+        _last_purge = now
+        cursor.execute("DELETE FROM idempotency_keys WHERE expires_at <= datetime('now')")
+    cursor.execute('''
+        DELETE FROM idempotency_keys
+        WHERE user_id = ? AND idempotency_key = ?
+          AND (expires_at <= datetime('now') OR (status_code IS NULL AND created_at <= datetime('now', ?)))
+    ''', (user_id, key, f'-{IDEMPOTENCY_LOCK_SECONDS} seconds'))
+    
+    cursor.execute('''
+        INSERT OR IGNORE INTO idempotency_keys (user_id, idempotency_key, endpoint, request_hash, expires_at)
+        VALUES (?, ?, ?, ?, datetime('now', ?))
+    ''', (user_id, key, endpoint, request_hash, f'+{IDEMPOTENCY_TTL_SECONDS} seconds'))
+    if cursor.rowcount:
+        return None
+    
+    cursor.execute('''
+        SELECT endpoint, request_hash, status_code, response_body
+        FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?
+    ''', (user_id, key))
+    return dict(cursor.fetchone())
+
+def _store(conn, user_id, key, status_code, body):
+    conn.execute('''
+        UPDATE idempotency_keys SET status_code = ?, response_body = ?
+        WHERE user_id = ? AND idempotency_key = ?
+    ''', (status_code, body, user_id, key))
+
+def _release(conn, user_id, key):
+    conn.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ? AND status_code IS NULL',
+                 (user_id, key))
+
+def _release_quietly(user_id, key):
+    """Best-effort release; a claim that cannot be deleted expires after IDEMPOTENCY_LOCK_SECONDS"""
+    try:
+        writer.run(_release, user_id, key)
+    except sqlite3.Error as e:
+        logger.error('Could not release Idempotency-Key claim: %s', e)
+
+def _replay(record, endpoint, request_hash):
+    """Answer a repeated key from its record"""
+    if record['endpoint'] != endpoint or record['request_hash'] != request_hash:
+        return jsonify(standard_response('error', 'Idempotency-Key was already used for a different request')), 422
+    if record['status_code'] is None:
+        return jsonify(standard_response('error', 'A request with this Idempotency-Key is still in progress')), 409
+    response = Response(record['response_body'], status=record['status_code'], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(view):
+    """Honor the Idempotency-Key header on a POST route; place under @jwt_required()"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify(standard_response('error', f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters')), 400
+        
+        user_id = int(get_jwt_identity())
+        endpoint = request.endpoint
+        request_hash = _request_hash()
+        
+        # Replays are served without touching the writer
+        record = _lookup(user_id, key)
+        if record is not None:
+            return _replay(record, endpoint, request_hash)
+        
+        try:
+            record = writer.run(_claim, user_id, key, endpoint, request_hash)
+        except sqlite3.Error as e:
+            return jsonify(standard_response('error', str(e))), 500
+        if record is not None:
+            return _replay(record, endpoint, request_hash)
+        
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _release_quietly(user_id, key)
+            raise
+        
+        if response.status_code >= 500:
+            # Server errors are not final; let the client retry with the same key
+            _release_quietly(user_id, key)
+            return response
+        
+        try:
+            writer.run(_store, user_id, key, response.status_code, response.get_data(as_text=True))
+        except sqlite3.Error as e:
+            # Without a stored response the key must not stay claimed, or every retry gets 409
+            logger.error('Could not store the response for an Idempotency-Key: %s', e)
+            _release_quietly(user_id, key)
+            return jsonify(standard_response('error', str(e))), 500
+        return response
+    return wrapper
@@ -0,0 +1,286 @@
+"""
+Prometheus-style request metrics.
+
+Each worker process counts requests, errors and latency per endpoint in
+memory and periodically adds the deltas into a small SQLite file next to
+the main database (metrics.db), so /api/metrics reports totals across all
+gunicorn workers. Point-in-time values (pool stats, writer queue depth,
+cache hit ratios, RSS) are published per process with a ``pid`` label and
+dropped once a worker stops refreshing them.
+"""
+import atexit
+import math
+import os
+import resource
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, request
+
+import cache
+import database
+from view_counter import view_counter
+from writer import writer
+
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Latency histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTERS = {
+    'shoplink_http_requests_total': ('counter', 'Requests handled, per endpoint'),
+    'shoplink_http_request_errors_total': ('counter', 'Requests answered with a 5xx status, per endpoint'),
+    'shoplink_http_request_duration_seconds': ('histogram', 'Request latency, per endpoint'),
+    'shoplink_db_queries_total': ('counter', 'SQL statements executed, per endpoint'),
+}
+
+GAUGES = {
+    'shoplink_db_pool_connections': 'Pooled SQLite connections by pool and state',
+    'shoplink_db_pool_connections_created': 'Connections opened by the pool since start',
+    'shoplink_writer_queue_depth': 'Jobs waiting for the single writer',
+    'shoplink_writer_lock_wait_seconds_total': 'Time the writer spent waiting for the SQLite write lock',
+    'shoplink_writer_busy_retries_total': 'Write-lock acquisitions retried after SQLITE_BUSY',
+    'shoplink_writer_avg_batch_size': 'Average jobs per group commit',
+    'shoplink_view_counter_pending': 'Page views buffered in memory, not yet written',
+    'shoplink_cache_hit_ratio': 'Hit ratio per in-process cache',
+    'shoplink_process_resident_memory_bytes': 'Resident set size of the worker process',
+}
+
+_collectors = []
+
+def register_collector(fn):
+    """Register ``fn() -> iterable of (gauge name, labels dict, value)``"""
+    _collectors.append(fn)
+    return fn
+
+def _labels(**labels):
+    return ','.join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+
+class MetricsStore:
+    """Per-process counters flushed as deltas into a shared SQLite file"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Never reuse a handle or deltas inherited across fork
+            self._pid = os.getpid()
+            self._pending = {}
+            self._conn = None
+
+    def _connection(self):
+        self._check_fork()
+        if self._conn is None:
+            path = os.path.join(os.path.dirname(database.DB_PATH), 'metrics.db')
+            conn = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (name, labels)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS gauges (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    value REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (name, labels, pid)
+                ) WITHOUT ROWID
+            ''')
+            self._conn = conn
+        return self._conn
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def observe_request(self, endpoint, method, status, seconds, queries=0):
+        labels = _labels(endpoint=endpoint, method=method)
+        with self._lock:
+            self._check_fork()
+            pending = self._pending
+            for key, value in (
+                (('shoplink_http_requests_total', labels), 1),
+                (('shoplink_db_queries_total', labels), queries),
+                (('shoplink_http_request_errors_total', labels), 1 if status >= 500 else 0),
+                (('shoplink_http_request_duration_seconds_sum', labels), seconds),
+                (('shoplink_http_request_duration_seconds_count', labels), 1),
+            ):
+                pending[key] = pending.get(key, 0) + value
+            # Buckets are cumulative, so summing them across workers stays valid
+            for bound in LATENCY_BUCKETS:
+                if seconds <= bound:
+                    key = ('shoplink_http_request_duration_seconds_bucket', f'{labels},le="{bound}"')
+                    pending[key] = pending.get(key, 0) + 1
+            key = ('shoplink_http_request_duration_seconds_bucket', f'{labels},le="+Inf"')
+            pending[key] = pending.get(key, 0) + 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Write pending counter deltas and this process's gauges"""
+        with self._lock:
+            conn = self._connection()
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            gauges = list(_collect_gauges())
+            pid = os.getpid()
+            now = time.time()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('''
+                    INSERT INTO counters (name, labels, value) VALUES (?, ?, ?)
+                    ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value
+                ''', [(name, labels, value) for (name, labels), value in pending.items()])
+                conn.execute('DELETE FROM gauges WHERE pid = ?', (pid,))
+                conn.executemany('INSERT INTO gauges (name, labels, pid, value, updated_at) VALUES (?, ?, ?, ?, ?)',
+                                 [(name, labels, pid, value, now) for name, labels, value in gauges])
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                # Keep the deltas for the next attempt
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def snapshot(self):
+        """Return (counter rows, live gauge rows) aggregated over all workers"""
+        self.flush()
+        with self._lock:
+            conn = self._connection()
+            stale_before = time.time() - max(METRICS_FLUSH_SECONDS * 6, 60)
+            conn.execute('DELETE FROM gauges WHERE updated_at < ?', (stale_before,))
+            counters = conn.execute('SELECT name, labels, value FROM counters ORDER BY name, labels').fetchall()
+            gauges = conn.execute('SELECT name, labels, pid, value FROM gauges ORDER BY name, labels, pid').fetchall()
+        return counters, gauges
+
+store = MetricsStore()
+
+def _collect_gauges():
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                yield name, _labels(**labels), value
+        except Exception:
+            continue
+
+def _resident_memory_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # Peak RSS where /proc is unavailable (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+@register_collector
+def _process_gauges():
+    yield 'shoplink_process_resident_memory_bytes', {}, _resident_memory_bytes()
+
+@register_collector
+def _pool_gauges():
+    for pool, stats in database.pool_stats().items():
+        yield 'shoplink_db_pool_connections', {'pool': pool, 'state': 'idle'}, stats['idle']
+        yield 'shoplink_db_pool_connections', {'pool': pool, 'state': 'in_use'}, stats['in_use']
+        yield 'shoplink_db_pool_connections_created', {'pool': pool}, stats['created']
+
+@register_collector
+def _writer_gauges():
+    stats = writer.stats()
+    yield 'shoplink_writer_queue_depth', {}, stats['queue_depth']
+    yield 'shoplink_writer_lock_wait_seconds_total', {}, stats['lock_wait_ms_total'] / 1000
+    yield 'shoplink_writer_busy_retries_total', {}, stats['busy_retries']
+    yield 'shoplink_writer_avg_batch_size', {}, stats['avg_batch_size']
+
+@register_collector
+def _view_counter_gauges():
+    yield 'shoplink_view_counter_pending', {}, view_counter.stats()['pending_views']
+
+@register_collector
+def _cache_gauges():
+    for c in cache.all_caches() + [database.query_cache]:
+        yield 'shoplink_cache_hit_ratio', {'cache': c.name}, c.stats()['hit_ratio']
+
+def _sort_key(row):
+    # Order histogram buckets numerically by their le bound
+    name, labels, _ = row
+    prefix, _, le = labels.partition(',le="')
+    return name, prefix, float(le.rstrip('"')) if le else 0.0
+
+def _format_value(value):
+    """Exact sample value; %g would round counters past 1e6 to 6 significant digits"""
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    counters, gauges = store.snapshot()
+    lines = []
+    families = {}
+    for name, labels, value in counters:
+        for family in COUNTERS:
+            if name == family or name.startswith(family + '_'):
+                families.setdefault(family, []).append((name, labels, value))
+                break
+    for family, (kind, help_text) in COUNTERS.items():
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families.get(family, []), key=_sort_key):
+            lines.append(f'{name}{{{labels}}} {_format_value(value)}')
+    by_name = {}
+    for name, labels, pid, value in gauges:
+        by_name.setdefault(name, []).append((labels, pid, value))
+    for name, help_text in GAUGES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, pid, value in by_name.get(name, []):
+            labels = f'{labels},pid="{pid}"' if labels else f'pid="{pid}"'
+            lines.append(f'{name}{{{labels}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+def _before_request():
+    g._request_started = time.perf_counter()
+
+def _after_request(response):
+    started = g.get('_request_started')
+    if started is not None and request.path != '/api/metrics':
+        scope = database.request_query_scope()
+        store.observe_request(request.endpoint or 'unmatched', request.method, response.status_code,
+                              time.perf_counter() - started, scope.count if scope else 0)
+        store.maybe_flush()
+    return response
+
+def metrics_response():
+    """Response for the /api/metrics endpoint (optionally behind METRICS_TOKEN)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def init_app(app):
+    """Register the request timing hooks"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    atexit.register(store.flush)
@@ -0,0 +1,64 @@
+-- Composite and partial indexes shaped after the queries the routes run.
+-- check_query_plans.py verifies that none of those queries falls back to a
+-- full table scan or a temp B-tree sort with this index set.
+
+-- shops.list_shops: active shops newest first, optionally by category
+CREATE INDEX IF NOT EXISTS idx_shops_active_created ON shops(created_at) WHERE is_active = 1;
+CREATE INDEX IF NOT EXISTS idx_shops_active_category_created ON shops(category, created_at) WHERE is_active = 1;
+
+-- users.get_user_shops / analytics: shops by owner, newest first
+CREATE INDEX IF NOT EXISTS idx_shops_owner_created ON shops(owner_id, created_at);
+DROP INDEX IF EXISTS idx_shops_owner;
+
+-- shops.get_shop_products: available products of a shop, newest first
+CREATE INDEX IF NOT EXISTS idx_products_shop_available_created ON products(shop_id, created_at) WHERE is_available = 1;
+-- products slug checks and per-shop aggregates
+CREATE INDEX IF NOT EXISTS idx_products_shop_slug ON products(shop_id, slug);
+DROP INDEX IF EXISTS idx_products_shop;
+-- analytics.get_alerts: low stock products per shop
+CREATE INDEX IF NOT EXISTS idx_products_shop_stock ON products(shop_id, stock_quantity) WHERE is_available = 1;
+
+-- orders.get_orders: a shop's / a user's orders, newest first
+CREATE INDEX IF NOT EXISTS idx_orders_shop_created ON orders(shop_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at);
+DROP INDEX IF EXISTS idx_orders_shop;
+DROP INDEX IF EXISTS idx_orders_user;
+-- analytics.get_sales_analytics: completed orders grouped by day and month (covering)
+CREATE INDEX IF NOT EXISTS idx_orders_completed_day ON orders(shop_id, DATE(created_at), total_amount) WHERE status = 'completed';
+CREATE INDEX IF NOT EXISTS idx_orders_completed_month ON orders(shop_id, strftime('%Y-%m', created_at), total_amount) WHERE status = 'completed';
+
+-- order line items and payments by order
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_payments_order ON payments(order_id);
+
+-- notifications: a user's feed, unread filter and unread count
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_read_created ON notifications(user_id, is_read, created_at);
+DROP INDEX IF EXISTS idx_notifications_user;
+
+-- events.list_events: upcoming events ordered by start date, optional filters
+CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_date);
+CREATE INDEX IF NOT EXISTS idx_events_published_start ON events(is_published, start_date);
+CREATE INDEX IF NOT EXISTS idx_events_status_start ON events(status, start_date);
+-- organizer dashboards and users.get_user_events
+CREATE INDEX IF NOT EXISTS idx_events_organizer_start ON events(organizer_id, start_date);
+CREATE INDEX IF NOT EXISTS idx_events_organizer_created ON events(organizer_id, created_at);
+DROP INDEX IF EXISTS idx_events_organizer;
+-- events slug checks
+CREATE INDEX IF NOT EXISTS idx_events_slug ON events(slug);
+-- events.get_event_registrations
+CREATE INDEX IF NOT EXISTS idx_event_registrations_event_created ON event_registrations(event_id, created_at);
+
+-- reviews: per shop / product listings and the one-review-per-user check
+CREATE INDEX IF NOT EXISTS idx_shop_reviews_shop_created ON shop_reviews(shop_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_shop_reviews_shop_user ON shop_reviews(shop_id, user_id);
+CREATE INDEX IF NOT EXISTS idx_product_reviews_product_created ON product_reviews(product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_product_reviews_product_user ON product_reviews(product_id, user_id);
+
+-- followers: follower list per shop and shops followed by a user
+CREATE INDEX IF NOT EXISTS idx_shop_followers_shop_created ON shop_followers(shop_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_shop_followers_user ON shop_followers(user_id);
+
+-- cart.get_cart: a user's cart, newest first
+CREATE INDEX IF NOT EXISTS idx_cart_user_created ON cart_items(user_id, created_at);
+DROP INDEX IF EXISTS idx_cart_user;
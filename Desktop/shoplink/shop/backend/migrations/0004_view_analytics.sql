@@ -0,0 +1,30 @@
+-- Append-only page-view log, written in batches by view_counter.py, and the
+-- hourly/daily rollups that rollups.py compacts it into. Raw events are
+-- deleted once rolled up, so view_events only holds the last hour or so.
+CREATE TABLE IF NOT EXISTS view_events (
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    viewed_at INTEGER NOT NULL,
+    viewer_hash INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_view_events_viewed_at ON view_events(viewed_at);
+
+CREATE TABLE IF NOT EXISTS view_stats_hourly (
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    hour TEXT NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    unique_viewers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (entity_type, entity_id, hour)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_view_stats_hourly_hour ON view_stats_hourly(hour);
+
+CREATE TABLE IF NOT EXISTS view_stats_daily (
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    unique_viewers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (entity_type, entity_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_view_stats_daily_day ON view_stats_daily(day);
@@ -0,0 +1,34 @@
+"""
+Running rating aggregates on shops and products: rating_sum, rating_count
+and a 1-5 star histogram, backfilled from the review tables. The review
+routes keep them up to date incrementally; reconcile.py rebuilds them.
+"""
+
+COLUMNS = ('rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
+
+# (aggregate table, review table, review foreign key)
+TABLES = (
+    ('shops', 'shop_reviews', 'shop_id'),
+    ('products', 'product_reviews', 'product_id'),
+)
+
+def upgrade(conn):
+    for table, reviews, key in TABLES:
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for column in COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+        conn.execute(f'''
+            UPDATE {table} SET ({', '.join(COLUMNS)}) = (
+                SELECT COALESCE(SUM(rating), 0), COUNT(*),
+                       COUNT(CASE WHEN rating = 1 THEN 1 END), COUNT(CASE WHEN rating = 2 THEN 1 END),
+                       COUNT(CASE WHEN rating = 3 THEN 1 END), COUNT(CASE WHEN rating = 4 THEN 1 END),
+                       COUNT(CASE WHEN rating = 5 THEN 1 END)
+                FROM {reviews} WHERE {key} = {table}.id
+            )
+        ''')
+        conn.execute(f'''
+            UPDATE {table}
+            SET reviews_count = rating_count,
+                rating = CASE WHEN rating_count > 0 THEN rating_sum * 1.0 / rating_count ELSE 0 END
+        ''')
@@ -0,0 +1,160 @@
+-- Denormalized counters maintained by triggers instead of by each route:
+--   shops.followers_count, shops.product_count (available products),
+--   shops.total_sales, shops.reviews_count + rating aggregates,
+--   products.reviews_count + rating aggregates, products.sales_count,
+--   events.registrations_count.
+-- Decrements are clamped at zero. reconcile.py verifies and repairs drift.
+
+CREATE TRIGGER IF NOT EXISTS trg_shop_followers_insert
+AFTER INSERT ON shop_followers BEGIN
+    UPDATE shops SET followers_count = followers_count + 1 WHERE id = NEW.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shop_followers_delete
+AFTER DELETE ON shop_followers BEGIN
+    UPDATE shops SET followers_count = MAX(followers_count - 1, 0) WHERE id = OLD.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_event_registrations_insert
+AFTER INSERT ON event_registrations BEGIN
+    UPDATE events SET registrations_count = registrations_count + 1 WHERE id = NEW.event_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_event_registrations_delete
+AFTER DELETE ON event_registrations BEGIN
+    UPDATE events SET registrations_count = MAX(registrations_count - 1, 0) WHERE id = OLD.event_id;
+END;
+
+-- product_count counts available products only, so soft deletes and
+-- re-listing move it, and deleting an already hidden product does not
+CREATE TRIGGER IF NOT EXISTS trg_products_insert
+AFTER INSERT ON products WHEN NEW.is_available = 1 BEGIN
+    UPDATE shops SET product_count = product_count + 1 WHERE id = NEW.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_delete
+AFTER DELETE ON products WHEN OLD.is_available = 1 BEGIN
+    UPDATE shops SET product_count = MAX(product_count - 1, 0) WHERE id = OLD.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_availability
+AFTER UPDATE OF is_available, shop_id ON products
+WHEN (OLD.is_available = 1) IS NOT (NEW.is_available = 1) OR OLD.shop_id IS NOT NEW.shop_id BEGIN
+    UPDATE shops SET product_count = MAX(product_count - 1, 0) WHERE id = OLD.shop_id AND OLD.is_available = 1;
+    UPDATE shops SET product_count = product_count + 1 WHERE id = NEW.shop_id AND NEW.is_available = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_orders_insert
+AFTER INSERT ON orders BEGIN
+    UPDATE shops SET total_sales = total_sales + NEW.total_amount WHERE id = NEW.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_orders_delete
+AFTER DELETE ON orders BEGIN
+    UPDATE shops SET total_sales = MAX(total_sales - OLD.total_amount, 0) WHERE id = OLD.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_order_items_insert
+AFTER INSERT ON order_items BEGIN
+    UPDATE products SET sales_count = sales_count + NEW.quantity WHERE id = NEW.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_order_items_delete
+AFTER DELETE ON order_items BEGIN
+    UPDATE products SET sales_count = MAX(sales_count - OLD.quantity, 0) WHERE id = OLD.product_id;
+END;
+
+-- Reviews: count, running rating sum and the 1-5 star histogram
+CREATE TRIGGER IF NOT EXISTS trg_shop_reviews_insert
+AFTER INSERT ON shop_reviews BEGIN
+    UPDATE shops SET
+        reviews_count = reviews_count + 1,
+        rating_sum = rating_sum + NEW.rating,
+        rating_count = rating_count + 1,
+        rating_1 = rating_1 + (NEW.rating = 1),
+        rating_2 = rating_2 + (NEW.rating = 2),
+        rating_3 = rating_3 + (NEW.rating = 3),
+        rating_4 = rating_4 + (NEW.rating = 4),
+        rating_5 = rating_5 + (NEW.rating = 5),
+        rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+    WHERE id = NEW.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shop_reviews_delete
+AFTER DELETE ON shop_reviews BEGIN
+    UPDATE shops SET
+        reviews_count = MAX(reviews_count - 1, 0),
+        rating_sum = MAX(rating_sum - OLD.rating, 0),
+        rating_count = MAX(rating_count - 1, 0),
+        rating_1 = MAX(rating_1 - (OLD.rating = 1), 0),
+        rating_2 = MAX(rating_2 - (OLD.rating = 2), 0),
+        rating_3 = MAX(rating_3 - (OLD.rating = 3), 0),
+        rating_4 = MAX(rating_4 - (OLD.rating = 4), 0),
+        rating_5 = MAX(rating_5 - (OLD.rating = 5), 0),
+        rating = CASE WHEN rating_count > 1 THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1) ELSE 0 END
+    WHERE id = OLD.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shop_reviews_rating
+AFTER UPDATE OF rating ON shop_reviews WHEN OLD.rating IS NOT NEW.rating BEGIN
+    UPDATE shops SET
+        rating_sum = rating_sum - OLD.rating + NEW.rating,
+        rating_1 = MAX(rating_1 - (OLD.rating = 1), 0) + (NEW.rating = 1),
+        rating_2 = MAX(rating_2 - (OLD.rating = 2), 0) + (NEW.rating = 2),
+        rating_3 = MAX(rating_3 - (OLD.rating = 3), 0) + (NEW.rating = 3),
+        rating_4 = MAX(rating_4 - (OLD.rating = 4), 0) + (NEW.rating = 4),
+        rating_5 = MAX(rating_5 - (OLD.rating = 5), 0) + (NEW.rating = 5),
+        rating = CASE WHEN rating_count > 0 THEN (rating_sum - OLD.rating + NEW.rating) * 1.0 / rating_count ELSE 0 END
+    WHERE id = NEW.shop_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_reviews_insert
+AFTER INSERT ON product_reviews BEGIN
+    UPDATE products SET
+        reviews_count = reviews_count + 1,
+        rating_sum = rating_sum + NEW.rating,
+        rating_count = rating_count + 1,
+        rating_1 = rating_1 + (NEW.rating = 1),
+        rating_2 = rating_2 + (NEW.rating = 2),
+        rating_3 = rating_3 + (NEW.rating = 3),
+        rating_4 = rating_4 + (NEW.rating = 4),
+        rating_5 = rating_5 + (NEW.rating = 5),
+        rating = (rating_sum + NEW.rating) * 1.0 / (rating_count + 1)
+    WHERE id = NEW.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_reviews_delete
+AFTER DELETE ON product_reviews BEGIN
+    UPDATE products SET
+        reviews_count = MAX(reviews_count - 1, 0),
+        rating_sum = MAX(rating_sum - OLD.rating, 0),
+        rating_count = MAX(rating_count - 1, 0),
+        rating_1 = MAX(rating_1 - (OLD.rating = 1), 0),
+        rating_2 = MAX(rating_2 - (OLD.rating = 2), 0),
+        rating_3 = MAX(rating_3 - (OLD.rating = 3), 0),
+        rating_4 = MAX(rating_4 - (OLD.rating = 4), 0),
+        rating_5 = MAX(rating_5 - (OLD.rating = 5), 0),
+        rating = CASE WHEN rating_count > 1 THEN (rating_sum - OLD.rating) * 1.0 / (rating_count - 1) ELSE 0 END
+    WHERE id = OLD.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_product_reviews_rating
+AFTER UPDATE OF rating ON product_reviews WHEN OLD.rating IS NOT NEW.rating BEGIN
+    UPDATE products SET
+        rating_sum = rating_sum - OLD.rating + NEW.rating,
+        rating_1 = MAX(rating_1 - (OLD.rating = 1), 0) + (NEW.rating = 1),
+        rating_2 = MAX(rating_2 - (OLD.rating = 2), 0) + (NEW.rating = 2),
+        rating_3 = MAX(rating_3 - (OLD.rating = 3), 0) + (NEW.rating = 3),
+        rating_4 = MAX(rating_4 - (OLD.rating = 4), 0) + (NEW.rating = 4),
+        rating_5 = MAX(rating_5 - (OLD.rating = 5), 0) + (NEW.rating = 5),
+        rating = CASE WHEN rating_count > 0 THEN (rating_sum - OLD.rating + NEW.rating) * 1.0 / rating_count ELSE 0 END
+    WHERE id = NEW.product_id;
+END;
+
+-- Start from exact values
+UPDATE shops SET
+    followers_count = (SELECT COUNT(*) FROM shop_followers WHERE shop_id = shops.id),
+    product_count = (SELECT COUNT(*) FROM products WHERE shop_id = shops.id AND is_available = 1),
+    total_sales = (SELECT COALESCE(SUM(total_amount), 0) FROM orders WHERE shop_id = shops.id);
+UPDATE products SET sales_count = (SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = products.id);
+UPDATE events SET registrations_count = (SELECT COUNT(*) FROM event_registrations WHERE event_id = events.id);
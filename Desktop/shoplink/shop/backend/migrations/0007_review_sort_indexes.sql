@@ -0,0 +1,17 @@
+-- Indexes for the review listing sort orders (reviews.py). Each sort is a
+-- keyset range read on (entity, sort column, created_at, id); newest first
+-- is already served by idx_*_reviews_*_created from 0002.
+
+-- A NULL flag would drop out of the (is_verified_purchase, created_at, id)
+-- cursor comparison, so normalise it first
+UPDATE shop_reviews SET is_verified_purchase = 0 WHERE is_verified_purchase IS NULL;
+UPDATE product_reviews SET is_verified_purchase = 0 WHERE is_verified_purchase IS NULL;
+
+-- highest / lowest rating first
+CREATE INDEX IF NOT EXISTS idx_shop_reviews_shop_rating ON shop_reviews(shop_id, rating, created_at);
+CREATE INDEX IF NOT EXISTS idx_product_reviews_product_rating ON product_reviews(product_id, rating, created_at);
+
+-- verified purchases first
+CREATE INDEX IF NOT EXISTS idx_shop_reviews_shop_verified ON shop_reviews(shop_id, is_verified_purchase, created_at);
+CREATE INDEX IF NOT EXISTS idx_product_reviews_product_verified
+    ON product_reviews(product_id, is_verified_purchase, created_at);
@@ -0,0 +1,46 @@
+-- Full-text index for /api/products/search. One row per available product,
+-- keyed by products.id (the FTS rowid), carrying the shop name so a search
+-- for a shop's name finds its products. Triggers keep it in sync; hidden
+-- (soft-deleted) products are removed from it.
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, description, tags, category, shop_name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- Column weights for bm25: a hit in the name counts most
+INSERT INTO products_fts (products_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0, 3.0, 2.0)');
+
+DELETE FROM products_fts;
+INSERT INTO products_fts (rowid, name, description, tags, category, shop_name)
+SELECT p.id, p.name, p.description, p.tags, p.category, s.name
+FROM products p JOIN shops s ON s.id = p.shop_id
+WHERE p.is_available = 1;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert
+AFTER INSERT ON products WHEN NEW.is_available = 1 BEGIN
+    INSERT INTO products_fts (rowid, name, description, tags, category, shop_name)
+    VALUES (NEW.id, NEW.name, NEW.description, NEW.tags, NEW.category,
+            (SELECT name FROM shops WHERE id = NEW.shop_id));
+END;
+
+-- Only the indexed columns (and availability) fire this, so stock and view
+-- count updates never touch the index
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+AFTER UPDATE OF name, description, tags, category, is_available, shop_id ON products BEGIN
+    DELETE FROM products_fts WHERE rowid = OLD.id;
+    INSERT INTO products_fts (rowid, name, description, tags, category, shop_name)
+    SELECT NEW.id, NEW.name, NEW.description, NEW.tags, NEW.category, name
+    FROM shops WHERE id = NEW.shop_id AND NEW.is_available = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete
+AFTER DELETE ON products BEGIN
+    DELETE FROM products_fts WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_fts_rename
+AFTER UPDATE OF name ON shops WHEN NEW.name IS NOT OLD.name BEGIN
+    UPDATE products_fts SET shop_name = NEW.name
+    WHERE rowid IN (SELECT id FROM products WHERE shop_id = NEW.id AND is_available = 1);
+END;
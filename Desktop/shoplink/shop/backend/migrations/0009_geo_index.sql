@@ -0,0 +1,55 @@
+-- R*Tree indexes over shop and event coordinates for the nearby endpoints
+-- (geo.py). Each point is stored as a zero-size box keyed by the row id;
+-- rows without valid coordinates are left out. Triggers keep them in sync.
+CREATE VIRTUAL TABLE IF NOT EXISTS shops_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+
+DELETE FROM shops_geo;
+INSERT INTO shops_geo (id, min_lat, max_lat, min_lng, max_lng)
+SELECT id, latitude, latitude, longitude, longitude FROM shops
+WHERE latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180;
+
+DELETE FROM events_geo;
+INSERT INTO events_geo (id, min_lat, max_lat, min_lng, max_lng)
+SELECT id, latitude, latitude, longitude, longitude FROM events
+WHERE latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_geo_insert
+AFTER INSERT ON shops
+WHEN NEW.latitude BETWEEN -90 AND 90 AND NEW.longitude BETWEEN -180 AND 180 BEGIN
+    INSERT INTO shops_geo (id, min_lat, max_lat, min_lng, max_lng)
+    VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_geo_update
+AFTER UPDATE OF latitude, longitude ON shops BEGIN
+    DELETE FROM shops_geo WHERE id = OLD.id;
+    INSERT INTO shops_geo (id, min_lat, max_lat, min_lng, max_lng)
+    SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+    WHERE NEW.latitude BETWEEN -90 AND 90 AND NEW.longitude BETWEEN -180 AND 180;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_geo_delete
+AFTER DELETE ON shops BEGIN
+    DELETE FROM shops_geo WHERE id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_events_geo_insert
+AFTER INSERT ON events
+WHEN NEW.latitude BETWEEN -90 AND 90 AND NEW.longitude BETWEEN -180 AND 180 BEGIN
+    INSERT INTO events_geo (id, min_lat, max_lat, min_lng, max_lng)
+    VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_events_geo_update
+AFTER UPDATE OF latitude, longitude ON events BEGIN
+    DELETE FROM events_geo WHERE id = OLD.id;
+    INSERT INTO events_geo (id, min_lat, max_lat, min_lng, max_lng)
+    SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+    WHERE NEW.latitude BETWEEN -90 AND 90 AND NEW.longitude BETWEEN -180 AND 180;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_events_geo_delete
+AFTER DELETE ON events BEGIN
+    DELETE FROM events_geo WHERE id = OLD.id;
+END;
@@ -0,0 +1,96 @@
+"""
+Precomputed map clusters for /api/map/clusters.
+
+geo_cells splits the world into a 2^level x 2^level grid of equal
+latitude/longitude cells at every level listed in geo_levels. For each
+cell and category it keeps the number of shops (active) or events
+(published) with valid coordinates, plus the sums of their coordinates
+for the centroid. Triggers on shops and events move rows between cells as
+coordinates, category or visibility change, so a map request only reads
+the cells in view.
+"""
+
+LEVELS = tuple(range(1, 17))
+
+# (kind stored in geo_cells, source table, visibility column)
+SOURCES = (
+    ('shop', 'shops', 'is_active'),
+    ('event', 'events', 'is_published'),
+)
+
+VALID = '{row}.latitude BETWEEN -90 AND 90 AND {row}.longitude BETWEEN -180 AND 180'
+
+def _cell(row):
+    """level, cell_x, cell_y and category of ``row`` (NEW/OLD) at each geo_levels.level"""
+    return f'''level,
+        MIN(CAST(({row}.longitude + 180) * (1 << level) / 360 AS INTEGER), (1 << level) - 1),
+        MIN(CAST(({row}.latitude + 90) * (1 << level) / 180 AS INTEGER), (1 << level) - 1),
+        COALESCE({row}.category, '')'''
+
+def _add(kind, row, condition):
+    return f'''
+        INSERT INTO geo_cells (kind, level, cell_x, cell_y, category, count, lat_sum, lng_sum)
+        SELECT '{kind}', {_cell(row)}, 1, {row}.latitude, {row}.longitude
+        FROM geo_levels WHERE {condition.format(row=row)} AND {VALID.format(row=row)}
+        ON CONFLICT (kind, level, cell_x, cell_y, category) DO UPDATE SET
+            count = count + 1, lat_sum = lat_sum + excluded.lat_sum, lng_sum = lng_sum + excluded.lng_sum;
+    '''
+
+def _remove(kind, row, condition):
+    cells = f'''(level, cell_x, cell_y, category) IN (
+            SELECT {_cell(row)} FROM geo_levels
+            WHERE {condition.format(row=row)} AND {VALID.format(row=row)}
+        )'''
+    return f'''
+        UPDATE geo_cells SET count = count - 1, lat_sum = lat_sum - {row}.latitude,
+                             lng_sum = lng_sum - {row}.longitude
+        WHERE kind = '{kind}' AND {cells};
+        DELETE FROM geo_cells WHERE kind = '{kind}' AND count <= 0 AND {cells};
+    '''
+
+def upgrade(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS geo_levels (level INTEGER PRIMARY KEY)')
+    conn.executemany('INSERT OR IGNORE INTO geo_levels (level) VALUES (?)', [(level,) for level in LEVELS])
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geo_cells (
+            kind TEXT NOT NULL,
+            level INTEGER NOT NULL,
+            cell_x INTEGER NOT NULL,
+            cell_y INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            lat_sum REAL NOT NULL,
+            lng_sum REAL NOT NULL,
+            PRIMARY KEY (kind, level, cell_x, cell_y, category)
+        ) WITHOUT ROWID
+    ''')
+
+    for kind, table, visible in SOURCES:
+        condition = f'{{row}}.{visible} = 1'
+        conn.execute('DELETE FROM geo_cells WHERE kind = ?', (kind,))
+        conn.execute(f'''
+            INSERT INTO geo_cells (kind, level, cell_x, cell_y, category, count, lat_sum, lng_sum)
+            SELECT '{kind}', {_cell('t')}, COUNT(*), SUM(t.latitude), SUM(t.longitude)
+            FROM {table} t JOIN geo_levels
+            WHERE {condition.format(row='t')} AND {VALID.format(row='t')}
+            GROUP BY 2, 3, 4, 5
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_geo_cells_insert
+            AFTER INSERT ON {table} BEGIN
+                {_add(kind, 'NEW', condition)}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_geo_cells_update
+            AFTER UPDATE OF latitude, longitude, category, {visible} ON {table} BEGIN
+                {_remove(kind, 'OLD', condition)}
+                {_add(kind, 'NEW', condition)}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_geo_cells_delete
+            AFTER DELETE ON {table} BEGIN
+                {_remove(kind, 'OLD', condition)}
+            END
+        ''')
@@ -0,0 +1,42 @@
+"""
+Make slugs unique: events.slug globally and products.slug per shop, like
+shops.slug already is. The old SELECT-per-suffix loops could race and
+store duplicates, so later duplicates are renamed to base-<id> first (or
+base-<id>-<n> if that is taken too).
+"""
+
+# (table, scope column or None, unique index, index it replaces)
+TABLES = (
+    ('events', None, 'idx_events_slug_unique', 'idx_events_slug'),
+    ('products', 'shop_id', 'idx_products_shop_slug_unique', 'idx_products_shop_slug'),
+)
+
+def _free(conn, table, scope, scope_id, slug):
+    if scope:
+        row = conn.execute(f'SELECT 1 FROM {table} WHERE {scope} = ? AND slug = ?', (scope_id, slug)).fetchone()
+    else:
+        row = conn.execute(f'SELECT 1 FROM {table} WHERE slug = ?', (slug,)).fetchone()
+    return row is None
+
+def upgrade(conn):
+    for table, scope, index, old_index in TABLES:
+        key = f'{scope}, slug' if scope else 'slug'
+        join = ' AND '.join(f'd.{column} = t.{column}' for column in key.split(', '))
+        duplicates = conn.execute(f'''
+            SELECT t.id, {'t.' + scope if scope else 'NULL'}, t.slug FROM {table} t
+            JOIN (
+                SELECT {key}, MIN(id) AS keep FROM {table}
+                WHERE slug IS NOT NULL GROUP BY {key} HAVING COUNT(*) > 1
+            ) d ON {join}
+            WHERE t.id != d.keep
+            ORDER BY t.id
+        ''').fetchall()
+        for row_id, scope_id, slug in duplicates:
+            candidate = f'{slug or table[:-1]}-{row_id}'
+            n = 1
+            while not _free(conn, table, scope, scope_id, candidate):
+                candidate = f'{slug or table[:-1]}-{row_id}-{n}'
+                n += 1
+            conn.execute(f'UPDATE {table} SET slug = ? WHERE id = ?', (candidate, row_id))
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table}({key})')
+        conn.execute(f'DROP INDEX IF EXISTS {old_index}')
@@ -0,0 +1,21 @@
+-- Version stamps for the in-process caches (cache.py). Every gunicorn
+-- worker keeps its own LRU, so a cached entry is only served while its
+-- stamp still matches the row here. Triggers bump the stamp in the same
+-- transaction as the change, which covers route writes as well as the
+-- counter triggers from 0006 (followers, reviews, product_count, sales).
+CREATE TABLE IF NOT EXISTS cache_versions (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_cache_version_update
+AFTER UPDATE ON shops BEGIN
+    INSERT INTO cache_versions (key, version) VALUES ('shop:' || NEW.id, 1)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_cache_version_delete
+AFTER DELETE ON shops BEGIN
+    INSERT INTO cache_versions (key, version) VALUES ('shop:' || OLD.id, 1)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,35 @@
+"""
+Catalog version stamps for the per-shop product listing cache.
+
+Every insert, delete or update of a product bumps 'catalog:<shop_id>' in
+cache_versions (migration 0012), both shops' stamps if a product moves.
+Updates that only touch views_count are left out: the view counter
+flushes them every few seconds and they would otherwise invalidate busy
+catalogs continuously, so cached listings may show view counts up to
+CACHE_TTL_SECONDS old. The update trigger names every other column of
+products; recreate it when adding columns that appear in listings.
+"""
+
+BUMP = '''
+    INSERT INTO cache_versions (key, version) VALUES ('catalog:' || {row}.shop_id, 1)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1;
+'''
+
+def upgrade(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(products)') if row[1] != 'views_count']
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_insert
+        AFTER INSERT ON products BEGIN {BUMP.format(row='NEW')} END
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS trg_products_catalog_version_update')
+    conn.execute(f'''
+        CREATE TRIGGER trg_products_catalog_version_update
+        AFTER UPDATE OF {', '.join(columns)} ON products BEGIN
+            {BUMP.format(row='NEW')}
+            {BUMP.format(row='OLD')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_products_catalog_version_delete
+        AFTER DELETE ON products BEGIN {BUMP.format(row='OLD')} END
+    ''')
@@ -0,0 +1,52 @@
+"""
+Change times for cache_versions, used as HTTP validators (http_cache.py).
+
+Adds cache_versions.changed_at and recreates the version triggers of
+0012 and 0013 to set it, adds the same stamp for events ('event:<id>',
+skipping views_count-only updates), and creates the 'shop:' and
+'catalog:' rows when a shop is inserted, so every shop, catalog and event
+has a version and a Last-Modified time without reading its rows. Existing
+resources are stamped with the time of this migration.
+"""
+
+BUMP = '''
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ({key}, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+'''
+
+def _bump(prefix, value):
+    return BUMP.format(key=f"'{prefix}:' || {value}")
+
+def _columns(conn, table):
+    """Columns of ``table`` whose updates change its cached payloads"""
+    return ', '.join(row[1] for row in conn.execute(f'PRAGMA table_info({table})') if row[1] != 'views_count')
+
+def _trigger(conn, name, event, table, body):
+    conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute(f'CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN {body} END')
+
+def upgrade(conn):
+    if 'changed_at' not in [row[1] for row in conn.execute('PRAGMA table_info(cache_versions)')]:
+        conn.execute('ALTER TABLE cache_versions ADD COLUMN changed_at TEXT')
+
+    _trigger(conn, 'trg_shops_cache_version_insert', 'INSERT', 'shops',
+             _bump('shop', 'NEW.id') + _bump('catalog', 'NEW.id'))
+    _trigger(conn, 'trg_shops_cache_version_update', 'UPDATE', 'shops', _bump('shop', 'NEW.id'))
+    _trigger(conn, 'trg_shops_cache_version_delete', 'DELETE', 'shops', _bump('shop', 'OLD.id'))
+
+    _trigger(conn, 'trg_products_catalog_version_insert', 'INSERT', 'products', _bump('catalog', 'NEW.shop_id'))
+    _trigger(conn, 'trg_products_catalog_version_update', f'UPDATE OF {_columns(conn, "products")}', 'products',
+             _bump('catalog', 'NEW.shop_id') + _bump('catalog', 'OLD.shop_id'))
+    _trigger(conn, 'trg_products_catalog_version_delete', 'DELETE', 'products', _bump('catalog', 'OLD.shop_id'))
+
+    _trigger(conn, 'trg_events_cache_version_insert', 'INSERT', 'events', _bump('event', 'NEW.id'))
+    _trigger(conn, 'trg_events_cache_version_update', f'UPDATE OF {_columns(conn, "events")}', 'events',
+             _bump('event', 'NEW.id'))
+    _trigger(conn, 'trg_events_cache_version_delete', 'DELETE', 'events', _bump('event', 'OLD.id'))
+
+    for prefix, table in (('shop', 'shops'), ('catalog', 'shops'), ('event', 'events')):
+        conn.execute(f'''
+            INSERT OR IGNORE INTO cache_versions (key, version, changed_at)
+            SELECT '{prefix}:' || id, 1, CURRENT_TIMESTAMP FROM {table}
+        ''')
+    conn.execute('UPDATE cache_versions SET changed_at = CURRENT_TIMESTAMP WHERE changed_at IS NULL')
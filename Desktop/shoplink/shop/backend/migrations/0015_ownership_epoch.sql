@@ -0,0 +1,26 @@
+-- Ownership epoch for the authorization caches (authz.py): any change to
+-- which user owns a shop, or which shop a product belongs to, bumps the
+-- 'ownership' row of cache_versions so workers drop their cached mappings.
+CREATE TRIGGER IF NOT EXISTS trg_shops_ownership_update
+AFTER UPDATE OF owner_id ON shops WHEN OLD.owner_id IS NOT NEW.owner_id BEGIN
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ('ownership', 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_shops_ownership_delete
+AFTER DELETE ON shops BEGIN
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ('ownership', 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_ownership_update
+AFTER UPDATE OF shop_id ON products WHEN OLD.shop_id IS NOT NEW.shop_id BEGIN
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ('ownership', 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_products_ownership_delete
+AFTER DELETE ON products BEGIN
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ('ownership', 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+END;
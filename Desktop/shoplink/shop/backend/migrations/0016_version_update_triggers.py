@@ -0,0 +1,38 @@
+"""
+Recreate the catalog and event version update triggers of 0013 and 0014
+without a column list.
+
+Those fired on UPDATE OF every column except views_count, so a column
+added by a later migration would not bump the version, and the catalog
+cache and the 304 validators would keep serving the old payload. The
+triggers now fire on any update and skip only one case: views_count
+changed and every other column stayed the same. That is the view
+counter's flush. A column added later is not in the comparison, so
+changing it never counts as a views_count-only update and always bumps.
+"""
+
+BUMP = '''
+    INSERT INTO cache_versions (key, version, changed_at) VALUES ({key}, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+'''
+
+def _bump(prefix, value):
+    return BUMP.format(key=f"'{prefix}:' || {value}")
+
+def _views_only(conn, table):
+    """WHEN condition that holds for updates changing views_count and nothing else"""
+    unchanged = ' AND '.join(f'NEW.{row[1]} IS OLD.{row[1]}' for row in conn.execute(f'PRAGMA table_info({table})')
+                             if row[1] != 'views_count')
+    return f'NEW.views_count IS NOT OLD.views_count AND {unchanged}'
+
+def _trigger(conn, name, table, body):
+    conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute(f'''
+        CREATE TRIGGER {name} AFTER UPDATE ON {table}
+        WHEN NOT ({_views_only(conn, table)}) BEGIN {body} END
+    ''')
+
+def upgrade(conn):
+    _trigger(conn, 'trg_products_catalog_version_update', 'products',
+             _bump('catalog', 'NEW.shop_id') + _bump('catalog', 'OLD.shop_id'))
+    _trigger(conn, 'trg_events_cache_version_update', 'events', _bump('event', 'NEW.id'))
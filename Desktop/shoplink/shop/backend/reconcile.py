@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Verify and repair denormalized counters.
+Triggers (migration 0006) keep the counters on shops, products and events
+in step with the raw tables; this recomputes them from those tables and
+fixes any row that has drifted. Work is done in chunks of
+RECONCILE_CHUNK_SIZE rows, one short writer job per chunk with a pause in
+between, so normal traffic keeps flowing while it runs.
+
+Usage: python reconcile.py [--check] [counter ...]
+With RECONCILE_INTERVAL_SECONDS set, the app also runs it in a background
+thread.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+from writer import writer
+
+RECONCILE_CHUNK_SIZE = int(os.getenv('RECONCILE_CHUNK_SIZE', 500))
+RECONCILE_PAUSE_MS = float(os.getenv('RECONCILE_PAUSE_MS', 20))
+RECONCILE_INTERVAL_SECONDS = float(os.getenv('RECONCILE_INTERVAL_SECONDS', 0))
+
+logger = logging.getLogger(__name__)
+
+def _rating_aggregate(reviews, key, table):
+    return f'''
+        SELECT COUNT(*), COALESCE(SUM(rating), 0), COUNT(*),
+               COUNT(CASE WHEN rating = 1 THEN 1 END), COUNT(CASE WHEN rating = 2 THEN 1 END),
+               COUNT(CASE WHEN rating = 3 THEN 1 END), COUNT(CASE WHEN rating = 4 THEN 1 END),
+               COUNT(CASE WHEN rating = 5 THEN 1 END),
+               CASE WHEN COUNT(*) > 0 THEN SUM(rating) * 1.0 / COUNT(*) ELSE 0 END
+        FROM {reviews} WHERE {key} = {table}.id
+    '''
+
+RATING_COLUMNS = ('reviews_count', 'rating_sum', 'rating_count',
+                  'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5', 'rating')
+
+# name: (table, columns, correlated aggregate over the raw rows, drift test)
+# The drift test defaults to comparing the columns with the aggregate.
+COUNTERS = {
+    'followers': ('shops', ('followers_count',),
+                  'SELECT COUNT(*) FROM shop_followers WHERE shop_id = shops.id', None),
+    'products': ('shops', ('product_count',),
+                 'SELECT COUNT(*) FROM products WHERE shop_id = shops.id AND is_available = 1', None),
+    # Money is summed in floating point, so allow for rounding
+    'sales': ('shops', ('total_sales',),
+              'SELECT COALESCE(SUM(total_amount), 0) FROM orders WHERE shop_id = shops.id',
+              'ABS(total_sales - ({aggregate})) > 0.005'),
+    'shop_ratings': ('shops', RATING_COLUMNS, _rating_aggregate('shop_reviews', 'shop_id', 'shops'), None),
+    'product_sales': ('products', ('sales_count',),
+                      'SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = products.id', None),
+    'product_ratings': ('products', RATING_COLUMNS,
+                        _rating_aggregate('product_reviews', 'product_id', 'products'), None),
+    'registrations': ('events', ('registrations_count',),
+                      'SELECT COUNT(*) FROM event_registrations WHERE event_id = events.id', None),
+}
+
+def _reconcile_chunk(conn, name, after_id, repair=True):
+    """Writer job: check (and repair) one chunk of rows; returns (last id, drifted rows)"""
+    table, columns, aggregate, drift = COUNTERS[name]
+    ids = [row[0] for row in conn.execute(f'SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+                                          (after_id, RECONCILE_CHUNK_SIZE))]
+    if not ids:
+        return None, 0
+    column_list = ', '.join(columns)
+    if drift is None:
+        drift = f'({column_list}) IS NOT ({aggregate})'
+    else:
+        drift = drift.format(aggregate=aggregate)
+    if repair:
+        drifted = conn.execute(f'''
+            UPDATE {table} SET ({column_list}) = ({aggregate})
+            WHERE id BETWEEN ? AND ? AND {drift}
+        ''', (ids[0], ids[-1])).rowcount
+    else:
+        drifted = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE id BETWEEN ? AND ? AND {drift}',
+                               (ids[0], ids[-1])).fetchone()[0]
+    return ids[-1], drifted
+
+def reconcile(names=None, repair=True):
+    """Check every counter (or the named ones); returns {name: drifted rows}"""
+    drifted = {}
+    for name in names or COUNTERS:
+        drifted[name] = 0
+        last_id = 0
+        while True:
+            last_id, count = writer.run(_reconcile_chunk, name, last_id, repair)
+            drifted[name] += count
+            if last_id is None:
+                break
+            time.sleep(RECONCILE_PAUSE_MS / 1000)
+        if drifted[name]:
+            logger.warning('%s: %d row(s) drifted%s', name, drifted[name], ' and were repaired' if repair else '')
+    return drifted
+
+def _background_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reconcile()
+        except Exception as e:
+            logger.error('Counter reconciliation failed: %s', e)
+
+def start_background(interval=RECONCILE_INTERVAL_SECONDS):
+    """Reconcile every ``interval`` seconds in a daemon thread (disabled when 0)"""
+    if interval > 0:
+        threading.Thread(target=_background_loop, args=(interval,), name='reconciler', daemon=True).start()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    repair = '--check' not in args
+    names = [arg for arg in args if arg != '--check']
+    unknown = [name for name in names if name not in COUNTERS]
+    if unknown:
+        print(f"Unknown counter(s): {', '.join(unknown)}; choose from {', '.join(COUNTERS)}")
+        sys.exit(2)
+    results = reconcile(names, repair)
+    for name, count in results.items():
+        print(f"{name}: {count} row(s) {'repaired' if repair else 'drifted'}")
+    if not repair and any(results.values()):
+        sys.exit(1)
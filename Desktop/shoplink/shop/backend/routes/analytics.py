@@ -1,11 +1,32 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from authz import owns_shop, product_shop, require_shop_owner
 from database import get_db
 from utils import standard_response
 from datetime import datetime, timedelta
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def _period_days(period, default=30):
+    """Parse a period like '7d' or '30' into a number of days (1-400)"""
+    try:
+        days = int(str(period or default).rstrip('d'))
+    except ValueError:
+        days = default
+    return max(1, min(days, 400))
+
+def _daily_views(cursor, shop_ids, since):
+    """Product views per day for the given shops, from the daily rollup"""
+    placeholders = ','.join('?' * len(shop_ids))
+    cursor.execute(f'''
+        SELECT d.day as date, SUM(d.views) as views, SUM(d.unique_viewers) as unique_viewers
+        FROM products p
+        JOIN view_stats_daily d ON d.entity_type = 'product' AND d.entity_id = p.id AND d.day >= ?
+        WHERE p.shop_id IN ({placeholders})
+        GROUP BY d.day
+    ''', (since, *shop_ids))
+    return {row['date']: dict(row) for row in cursor.fetchall()}
+
 @analytics_bp.route('/sales', methods=['GET'])
 @jwt_required()
 def get_sales_analytics():
@@ -258,6 +279,13 @@ def get_activity_analytics():
         if shop_views > 0:
             engagement_rate = (total_reviews / shop_views) * 100 if shop_views > 0 else 0
         
+        # Product views per day over the last 30 days
+        views_trend = []
+        if shop_ids:
+            since = (datetime.utcnow() - timedelta(days=29)).strftime('%Y-%m-%d')
+            daily = _daily_views(cursor, shop_ids, since)
+            views_trend = [daily[day] for day in sorted(daily)]
+        
         # Recent customer interactions (reviews in last 30 days)
         recent_interactions = 0
         if shop_ids:
@@ -278,7 +306,8 @@ def get_activity_analytics():
             'product_views': product_views,
             'total_reviews': total_reviews,
             'engagement_rate': round(engagement_rate, 2),
-            'recent_interactions': recent_interactions
+            'recent_interactions': recent_interactions,
+            'views_trend': views_trend
         })), 200
         
     except Exception as e:
@@ -367,3 +396,102 @@ def get_alerts():
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
+@analytics_bp.route('/shops/<int:shop_id>/daily', methods=['GET'])
+@jwt_required()
+@require_shop_owner()
+def get_shop_daily_analytics(shop_id):
+    try:
+        days = _period_days(request.args.get('period'))
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        first_day = datetime.utcnow().date() - timedelta(days=days - 1)
+        since = first_day.strftime('%Y-%m-%d')
+        views = _daily_views(cursor, [shop_id], since)
+        
+        cursor.execute('''
+            SELECT DATE(created_at) as date, COUNT(*) as orders, COALESCE(SUM(total_amount), 0) as revenue
+            FROM orders
+            WHERE shop_id = ? AND status = 'completed' AND DATE(created_at) >= ?
+            GROUP BY DATE(created_at)
+        ''', (shop_id, since))
+        sales = {row['date']: row for row in cursor.fetchall()}
+        
+        conn.close()
+        
+        # One entry per day, including days without views or orders
+        daily = []
+        for offset in range(days):
+            date = (first_day + timedelta(days=offset)).strftime('%Y-%m-%d')
+            day_views = views.get(date, {})
+            day_sales = sales.get(date)
+            daily.append({
+                'date': date,
+                'views': day_views.get('views', 0),
+                'unique_viewers': day_views.get('unique_viewers', 0),
+                'orders': day_sales['orders'] if day_sales else 0,
+                'revenue': day_sales['revenue'] if day_sales else 0
+            })
+        
+        return jsonify(standard_response('success', 'Daily analytics retrieved', daily)), 200
+        
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@analytics_bp.route('/views', methods=['GET'])
+@jwt_required()
+def get_view_analytics():
+    try:
+        user_id = int(get_jwt_identity())
+        entity_type = request.args.get('entity_type', 'product')
+        entity_id = request.args.get('entity_id', type=int)
+        granularity = request.args.get('granularity', 'day')
+        days = _period_days(request.args.get('period'))
+        
+        if entity_type not in ('product', 'event') or not entity_id:
+            return jsonify(standard_response('error', 'entity_type (product or event) and entity_id are required')), 400
+        if granularity not in ('day', 'hour'):
+            return jsonify(standard_response('error', 'granularity must be day or hour')), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # Verify ownership of the product's shop or the event
+        if entity_type == 'product':
+            shop_id = product_shop(cursor, entity_id)
+            allowed = shop_id is not None and owns_shop(cursor, shop_id, user_id)
+        else:
+            cursor.execute('SELECT organizer_id FROM events WHERE id = ?', (entity_id,))
+            event = cursor.fetchone()
+            allowed = event is not None and event['organizer_id'] == user_id
+        if not allowed:
+            conn.close()
+            return jsonify(standard_response('error', 'Unauthorized')), 403
+        
+        since = datetime.utcnow() - timedelta(days=days - 1)
+        if granularity == 'hour':
+            cursor.execute('''
+                SELECT hour as period, views, unique_viewers FROM view_stats_hourly
+                WHERE entity_type = ? AND entity_id = ? AND hour >= ?
+                ORDER BY hour ASC
+            ''', (entity_type, entity_id, since.strftime('%Y-%m-%d 00:00')))
+        else:
+            cursor.execute('''
+                SELECT day as period, views, unique_viewers FROM view_stats_daily
+                WHERE entity_type = ? AND entity_id = ? AND day >= ?
+                ORDER BY day ASC
+            ''', (entity_type, entity_id, since.strftime('%Y-%m-%d')))
+        series = [dict(row) for row in cursor.fetchall()]
+        
+        conn.close()
+        
+        return jsonify(standard_response('success', 'View analytics retrieved', {
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'granularity': granularity,
+            'series': series
+        })), 200
+        
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from database import get_db
-from utils import standard_response
+from utils import standard_response, ApiError
+from writer import writer
+from idempotency import idempotent
 
 cart_bp = Blueprint('cart', __name__)
 
@@ -29,8 +31,34 @@ def get_cart():
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
+def _add_to_cart(conn, user_id, product_id, quantity):
+    cursor = conn.cursor()
+    
+    # Verify product exists and is available
+    cursor.execute('SELECT id, stock_quantity, is_available FROM products WHERE id = ?', (product_id,))
+    product = cursor.fetchone()
+    if not product or not product['is_available']:
+        raise ApiError('Product not available', 404)
+    
+    if product['stock_quantity'] < quantity:
+        raise ApiError('Insufficient stock')
+    
+    # Check if already in cart
+    cursor.execute('SELECT id, quantity FROM cart_items WHERE user_id = ? AND product_id = ?', (user_id, product_id))
+    existing = cursor.fetchone()
+    
+    if existing:
+        new_quantity = existing['quantity'] + quantity
+        if product['stock_quantity'] < new_quantity:
+            raise ApiError('Insufficient stock')
+        cursor.execute('UPDATE cart_items SET quantity = ? WHERE id = ?', (new_quantity, existing['id']))
+    else:
+        cursor.execute('INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)', 
+                      (user_id, product_id, quantity))
+
 @cart_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def add_to_cart():
     try:
         user_id = int(get_jwt_identity())
@@ -42,39 +70,12 @@ def add_to_cart():
         if not product_id:
             return jsonify(standard_response('error', 'Product ID is required')), 400
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Verify product exists and is available
-        cursor.execute('SELECT id, stock_quantity, is_available FROM products WHERE id = ?', (product_id,))
-        product = cursor.fetchone()
-        if not product or not product['is_available']:
-            conn.close()
-            return jsonify(standard_response('error', 'Product not available')), 404
-        
-        if product['stock_quantity'] < quantity:
-            conn.close()
-            return jsonify(standard_response('error', 'Insufficient stock')), 400
-        
-        # Check if already in cart
-        cursor.execute('SELECT id, quantity FROM cart_items WHERE user_id = ? AND product_id = ?', (user_id, product_id))
-        existing = cursor.fetchone()
-        
-        if existing:
-            new_quantity = existing['quantity'] + quantity
-            if product['stock_quantity'] < new_quantity:
-                conn.close()
-                return jsonify(standard_response('error', 'Insufficient stock')), 400
-            cursor.execute('UPDATE cart_items SET quantity = ? WHERE id = ?', (new_quantity, existing['id']))
-        else:
-            cursor.execute('INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)', 
-                          (user_id, product_id, quantity))
-        
-        conn.commit()
-        conn.close()
+        writer.run(_add_to_cart, user_id, product_id, quantity)
         
         return jsonify(standard_response('success', 'Item added to cart')), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
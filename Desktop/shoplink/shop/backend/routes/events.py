@@ -1,12 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import get_db
-from utils import standard_response, generate_slug
+from authz import require_shop_owner
+from database import cached_query, get_db, read_only
+from view_counter import view_counter
+import geo
+import http_cache
+from slugs import write_with_slug
+from utils import standard_response, ApiError, decode_cursor, page_limit, paginate
+from idempotency import idempotent
+from writer import writer
 
 events_bp = Blueprint('events', __name__)
 
 @events_bp.route('', methods=['POST'])
 @jwt_required()
+@require_shop_owner(json_field='shop_id', forbidden='Unauthorized or shop not found')
 def create_event():
     try:
         user_id = int(get_jwt_identity())
@@ -18,33 +26,16 @@ def create_event():
         if not title or not start_date:
             return jsonify(standard_response('error', 'Title and start date are required')), 400
         
-        slug = generate_slug(title)
         conn = get_db()
         cursor = conn.cursor()
         
-        # Ensure unique slug
-        base_slug = slug
-        counter = 1
-        while True:
-            cursor.execute('SELECT id FROM events WHERE slug = ?', (slug,))
-            if not cursor.fetchone():
-                break
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        
         shop_id = data.get('shop_id')
-        if shop_id:
-            # Verify shop ownership
-            cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-            shop = cursor.fetchone()
-            if not shop or shop['owner_id'] != user_id:
-                conn.close()
-                return jsonify(standard_response('error', 'Unauthorized or shop not found')), 403
         
         ticket_price = data.get('ticket_price', 0)
         is_free = 1 if ticket_price == 0 or data.get('is_free', False) else 0
         
-        cursor.execute('''
+        # Insert under a unique slug, retried if a concurrent request takes it first
+        write_with_slug(cursor, 'events', title, lambda slug: cursor.execute('''
             INSERT INTO events (organizer_id, shop_id, title, slug, description, event_type, category,
                              start_date, end_date, location, venue_name, venue_address, venue_city,
                              venue_state, venue_country, latitude, longitude, meeting_url, max_attendees,
@@ -57,7 +48,7 @@ def create_event():
             data.get('venue_state'), data.get('venue_country'), data.get('latitude'),
             data.get('longitude'), data.get('meeting_url'), data.get('max_attendees'),
             ticket_price, is_free, data.get('is_published', 0), data.get('status', 'draft')
-        ))
+        )))
         
         event_id = cursor.lastrowid
         conn.commit()
@@ -72,35 +63,53 @@ def create_event():
         return jsonify(standard_response('error', str(e))), 500
 
 @events_bp.route('/<int:event_id>', methods=['GET'])
+@read_only
 def get_event(event_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
+        # Revalidation costs one indexed lookup; a repeat visit still counts as a view
+        cursor.execute('''
+            SELECT v.version, v.changed_at FROM events e
+            JOIN cache_versions v ON v.key = 'event:' || e.id
+            WHERE e.id = ?
+        ''', (event_id,))
+        stamp = cursor.fetchone()
+        if stamp:
+            etag, last_modified = http_cache.validators(f'event:{event_id}', *stamp)
+            if http_cache.is_fresh(etag, last_modified):
+                conn.close()
+                view_counter.add('events', event_id)
+                return http_cache.not_modified(etag, last_modified)
+        
         cursor.execute('SELECT * FROM events WHERE id = ?', (event_id,))
         event = cursor.fetchone()
         
-        if event:
-            # Increment views
-            cursor.execute('UPDATE events SET views_count = views_count + 1 WHERE id = ?', (event_id,))
-            conn.commit()
-        
         conn.close()
         
         if not event:
             return jsonify(standard_response('error', 'Event not found')), 404
         
-        return jsonify(standard_response('success', 'Event retrieved', dict(event))), 200
+        # Views are buffered in memory and written in batches
+        view_counter.add('events', event_id)
+        
+        response = jsonify(standard_response('success', 'Event retrieved', dict(event)))
+        if stamp:
+            http_cache.with_validators(response, etag, last_modified)
+        return response, 200
         
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
 @events_bp.route('', methods=['GET'])
+@read_only
 def list_events():
     try:
         status = request.args.get('status')
         is_published = request.args.get('is_published')
-        limit = int(request.args.get('limit', 20))
+        limit = page_limit(request.args.get('limit'))
+        after = request.args.get('cursor')
         offset = int(request.args.get('offset', 0))
         
         conn = get_db()
@@ -117,15 +126,74 @@ def list_events():
             query += ' AND is_published = ?'
             params.append(int(is_published))
         
-        query += ' ORDER BY start_date ASC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        # Keyset pagination on (start_date, id): every page is an index range read
+        if after:
+            query += ' AND (start_date, id) > (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY start_date ASC, id ASC LIMIT ?'
+        params.append(limit + 1)
+        
+        # offset is still accepted for older clients, but skips rows one by one
+        if offset and not after:
+            query += ' OFFSET ?'
+            params.append(offset)
+        
+        events, pagination = paginate(cached_query(cursor, query, params), limit, 'start_date', 'id')
+        conn.close()
+        
+        response = jsonify(standard_response('success', 'Events retrieved', events, pagination=pagination))
+        return http_cache.with_policy(response, 'list'), 200
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@events_bp.route('/nearby', methods=['GET'])
+@read_only
+def nearby_events():
+    try:
+        lat, lng, radius_km = geo.search_args(request.args)
+        limit = page_limit(request.args.get('limit'))
+        after = request.args.get('cursor')
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius_km)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # The R*Tree prefilters to the bounding box and haversine_km refines to the
+        # circle. LIMIT -1 keeps the candidates materialized, so the distance is
+        # computed once per candidate and only (distance, id) pairs are sorted.
+        query = '''
+            SELECT e.*, candidates.distance_km
+            FROM (
+                SELECT id, haversine_km(?, ?, min_lat, min_lng) AS distance_km FROM events_geo
+                WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ? LIMIT -1
+            ) candidates
+            JOIN events e ON e.id = candidates.id
+            WHERE e.is_published = 1 AND COALESCE(e.end_date, e.start_date) >= datetime('now') AND candidates.distance_km <= ?
+        '''
+        params = [lat, lng, min_lat, max_lat, min_lng, max_lng, radius_km]
+        
+        if after:
+            query += ' AND (candidates.distance_km, e.id) > (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY candidates.distance_km, e.id LIMIT ?'
+        params.append(limit + 1)
         
         cursor.execute(query, params)
-        events = [dict(row) for row in cursor.fetchall()]
+        events, pagination = paginate(cursor.fetchall(), limit, 'distance_km', 'id')
         conn.close()
         
-        return jsonify(standard_response('success', 'Events retrieved', events)), 200
+        for row in events:
+            row['distance_km'] = round(row['distance_km'], 3)
+        
+        return jsonify(standard_response('success', 'Nearby events retrieved', events, pagination=pagination)), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -164,25 +232,19 @@ def update_event(event_id):
                 values.append(data[field])
         
         if 'title' in data:
-            slug = generate_slug(data['title'])
-            base_slug = slug
-            counter = 1
-            while True:
-                cursor.execute('SELECT id FROM events WHERE slug = ? AND id != ?', (slug, event_id))
-                if not cursor.fetchone():
-                    break
-                slug = f"{base_slug}-{counter}"
-                counter += 1
+            # The new slug is allocated as the row is written
             updates.append('slug = ?')
-            values.append(slug)
         
         if not updates:
             conn.close()
             return jsonify(standard_response('error', 'No valid fields to update')), 400
         
-        values.append(event_id)
         query = f"UPDATE events SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
-        cursor.execute(query, values)
+        if 'title' in data:
+            write_with_slug(cursor, 'events', data['title'], lambda slug: cursor.execute(query, values + [slug, event_id]),
+                            exclude_id=event_id)
+        else:
+            cursor.execute(query, values + [event_id])
         conn.commit()
         
         cursor.execute('SELECT * FROM events WHERE id = ?', (event_id,))
@@ -194,40 +256,38 @@ def update_event(event_id):
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
+def _register_event(conn, event_id, user_id):
+    cursor = conn.cursor()
+    
+    # The capacity check and the insert run in one writer job, so two users cannot both take the last seat
+    cursor.execute('SELECT max_attendees, registrations_count FROM events WHERE id = ?', (event_id,))
+    event = cursor.fetchone()
+    if not event:
+        raise ApiError('Event not found', 404)
+    
+    if event['max_attendees'] and event['registrations_count'] >= event['max_attendees']:
+        raise ApiError('Event is full')
+    
+    # Check if already registered
+    cursor.execute('SELECT id FROM event_registrations WHERE event_id = ? AND user_id = ?', (event_id, user_id))
+    if cursor.fetchone():
+        raise ApiError('Already registered')
+    
+    # Register (registrations_count is maintained by a trigger)
+    cursor.execute('INSERT INTO event_registrations (event_id, user_id) VALUES (?, ?)', (event_id, user_id))
+
 @events_bp.route('/<int:event_id>/register', methods=['POST'])
 @jwt_required()
+@idempotent
 def register_event(event_id):
     try:
         user_id = int(get_jwt_identity())
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Check if event exists and has capacity
-        cursor.execute('SELECT max_attendees, registrations_count FROM events WHERE id = ?', (event_id,))
-        event = cursor.fetchone()
-        if not event:
-            conn.close()
-            return jsonify(standard_response('error', 'Event not found')), 404
-        
-        if event['max_attendees'] and event['registrations_count'] >= event['max_attendees']:
-            conn.close()
-            return jsonify(standard_response('error', 'Event is full')), 400
-        
-        # Check if already registered
-        cursor.execute('SELECT id FROM event_registrations WHERE event_id = ? AND user_id = ?', (event_id, user_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Already registered')), 400
-        
-        # Register
-        cursor.execute('INSERT INTO event_registrations (event_id, user_id) VALUES (?, ?)', (event_id, user_id))
-        cursor.execute('UPDATE events SET registrations_count = registrations_count + 1 WHERE id = ?', (event_id,))
-        conn.commit()
-        conn.close()
+        writer.run(_register_event, event_id, user_id)
         
         return jsonify(standard_response('success', 'Registered successfully')), 201
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
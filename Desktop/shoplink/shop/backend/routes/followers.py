@@ -1,38 +1,44 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import get_db
-from utils import standard_response
+from database import cached_query, get_db, read_only
+from utils import standard_response, ApiError
+from writer import writer
 
 followers_bp = Blueprint('followers', __name__)
 
+def _follow_shop(conn, shop_id, user_id):
+    cursor = conn.cursor()
+    
+    # Verify shop exists
+    cursor.execute('SELECT id FROM shops WHERE id = ?', (shop_id,))
+    if not cursor.fetchone():
+        raise ApiError('Shop not found', 404)
+    
+    # Check if already following
+    cursor.execute('SELECT id FROM shop_followers WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
+    if cursor.fetchone():
+        raise ApiError('Already following')
+    
+    # followers_count is maintained by a trigger
+    cursor.execute('INSERT INTO shop_followers (shop_id, user_id) VALUES (?, ?)', (shop_id, user_id))
+
+def _unfollow_shop(conn, shop_id, user_id):
+    # followers_count is maintained by a trigger
+    cursor = conn.execute('DELETE FROM shop_followers WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
+    if cursor.rowcount == 0:
+        raise ApiError('Not following', 404)
+
 @followers_bp.route('/shop/<int:shop_id>', methods=['POST'])
 @jwt_required()
 def follow_shop(shop_id):
     try:
         user_id = int(get_jwt_identity())
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Verify shop exists
-        cursor.execute('SELECT id FROM shops WHERE id = ?', (shop_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Shop not found')), 404
-        
-        # Check if already following
-        cursor.execute('SELECT id FROM shop_followers WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Already following')), 400
-        
-        cursor.execute('INSERT INTO shop_followers (shop_id, user_id) VALUES (?, ?)', (shop_id, user_id))
-        cursor.execute('UPDATE shops SET followers_count = followers_count + 1 WHERE id = ?', (shop_id,))
-        
-        conn.commit()
-        conn.close()
+        writer.run(_follow_shop, shop_id, user_id)
         
         return jsonify(standard_response('success', 'Shop followed')), 201
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -41,21 +47,12 @@ def follow_shop(shop_id):
 def unfollow_shop(shop_id):
     try:
         user_id = int(get_jwt_identity())
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM shop_followers WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
-        
-        if cursor.rowcount == 0:
-            conn.close()
-            return jsonify(standard_response('error', 'Not following')), 404
-        
-        cursor.execute('UPDATE shops SET followers_count = followers_count - 1 WHERE id = ?', (shop_id,))
-        conn.commit()
-        conn.close()
+        writer.run(_unfollow_shop, shop_id, user_id)
         
         return jsonify(standard_response('success', 'Shop unfollowed')), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -77,19 +74,20 @@ def check_follow_status(shop_id):
         return jsonify(standard_response('error', str(e))), 500
 
 @followers_bp.route('/shop/<int:shop_id>/followers', methods=['GET'])
+@read_only
 def get_shop_followers(shop_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        rows = cached_query(cursor, '''
             SELECT u.id, u.full_name, u.profile_photo, sf.created_at
             FROM shop_followers sf
             JOIN users u ON sf.user_id = u.id
             WHERE sf.shop_id = ?
             ORDER BY sf.created_at DESC
         ''', (shop_id,))
-        followers = [dict(row) for row in cursor.fetchall()]
+        followers = [dict(row) for row in rows]
         conn.close()
         
         return jsonify(standard_response('success', 'Followers retrieved', followers)), 200
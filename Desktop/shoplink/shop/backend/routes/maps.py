@@ -0,0 +1,70 @@
+from flask import Blueprint, request, jsonify
+from database import get_db, read_only
+from utils import standard_response, ApiError
+import geo
+
+maps_bp = Blueprint('maps', __name__)
+
+MAP_KINDS = {'shops': 'shop', 'events': 'event'}
+
+def _clusters(rows, level):
+    """Fold per-category cell rows into one cluster per cell with its top categories"""
+    cells = {}
+    for row in rows:
+        key = (row['cell_x'], row['cell_y'])
+        cell = cells.setdefault(key, {'count': 0, 'lat_sum': 0.0, 'lng_sum': 0.0, 'categories': []})
+        cell['count'] += row['count']
+        cell['lat_sum'] += row['lat_sum']
+        cell['lng_sum'] += row['lng_sum']
+        if row['category']:
+            cell['categories'].append((row['count'], row['category']))
+    clusters = []
+    for (x, y), cell in cells.items():
+        top = sorted(cell['categories'], reverse=True)[:3]
+        clusters.append({
+            'id': f'{level}/{x}/{y}',
+            'count': cell['count'],
+            'lat': round(cell['lat_sum'] / cell['count'], 5),
+            'lng': round(cell['lng_sum'] / cell['count'], 5),
+            'top_categories': [[category, count] for count, category in top]
+        })
+    return clusters
+
+@maps_bp.route('/clusters', methods=['GET'])
+@read_only
+def get_clusters():
+    try:
+        kind = MAP_KINDS.get(request.args.get('kind', 'shops'))
+        if not kind:
+            return jsonify(standard_response('error', 'kind must be shops or events')), 400
+        
+        zoom = request.args.get('zoom', type=int)
+        if zoom is None or not 0 <= zoom <= 22:
+            return jsonify(standard_response('error', 'zoom must be an integer between 0 and 22')), 400
+        
+        bbox = geo.bbox_args(request.args)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT level FROM geo_levels ORDER BY level')
+        level = geo.cluster_level([row['level'] for row in cursor.fetchall()], zoom, bbox)
+        x_ranges, (y0, y1) = geo.cell_ranges(level, *bbox)
+        
+        # Only the precomputed cells in view are read, never the shops or events themselves
+        rows = []
+        for x0, x1 in x_ranges:
+            cursor.execute('''
+                SELECT cell_x, cell_y, category, count, lat_sum, lng_sum FROM geo_cells
+                WHERE kind = ? AND level = ? AND cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?
+            ''', (kind, level, x0, x1, y0, y1))
+            rows.extend(cursor.fetchall())
+        conn.close()
+        
+        data = {'level': level, 'clusters': _clusters(rows, level)}
+        return jsonify(standard_response('success', 'Clusters retrieved', data)), 200
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
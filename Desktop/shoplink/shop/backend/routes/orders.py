@@ -1,12 +1,159 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from authz import owns_shop
 from database import get_db
-from utils import standard_response
+from utils import standard_response, ApiError
+from writer import writer
+from idempotency import idempotent
 
 orders_bp = Blueprint('orders', __name__)
 
+def _merge_quantities(items):
+    """Merge repeated lines so each product is checked and decremented once"""
+    quantities = {}
+    for item in items:
+        try:
+            product_id = int(item.get('product_id'))
+        except (TypeError, ValueError):
+            raise ApiError(f"Product {item.get('product_id')} not available")
+        quantity = int(item.get('quantity', 1))
+        if quantity < 1:
+            raise ApiError('Quantity must be at least 1')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+def _create_orders(cursor, user_id, shop_quantities, payment_method, shipping_address):
+    """Reserve stock and create one order per shop; shop_quantities is {shop_id: {product_id: quantity}}"""
+    shop_ids = list(shop_quantities)
+    product_ids = [product_id for quantities in shop_quantities.values() for product_id in quantities]
+    
+    # Verify shops exist
+    placeholders = ','.join('?' * len(shop_ids))
+    cursor.execute(f'SELECT id FROM shops WHERE id IN ({placeholders}) AND is_active = 1', shop_ids)
+    active_shops = {row['id'] for row in cursor.fetchall()}
+    for shop_id in shop_ids:
+        if shop_id not in active_shops:
+            raise ApiError('Shop not found', 404)
+    
+    # Fetch every product in one query
+    placeholders = ','.join('?' * len(product_ids))
+    cursor.execute(f'''
+        SELECT id, shop_id, price, stock_quantity, is_available FROM products
+        WHERE id IN ({placeholders})
+    ''', product_ids)
+    products = {row['id']: row for row in cursor.fetchall()}
+    
+    # Calculate totals and verify stock
+    totals = {}
+    lines = {}
+    for shop_id, quantities in shop_quantities.items():
+        totals[shop_id] = 0
+        lines[shop_id] = []
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if not product or product['shop_id'] != shop_id or not product['is_available']:
+                raise ApiError(f'Product {product_id} not available')
+            
+            if product['stock_quantity'] < quantity:
+                raise ApiError(f'Insufficient stock for product {product_id}')
+            
+            unit_price = product['price']
+            subtotal = unit_price * quantity
+            totals[shop_id] += subtotal
+            lines[shop_id].append((product_id, quantity, unit_price, subtotal))
+    
+    # Create orders
+    order_ids = {}
+    for shop_id in shop_ids:
+        cursor.execute('''
+            INSERT INTO orders (user_id, shop_id, status, total_amount, currency, payment_method, shipping_address)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, shop_id, 'pending', totals[shop_id], 'USD', payment_method, shipping_address))
+        order_ids[shop_id] = cursor.lastrowid
+    
+    cursor.executemany('''
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(order_ids[shop_id], *line) for shop_id in shop_ids for line in lines[shop_id]])
+    
+    # Decrement stock only where enough is left; a short rowcount means another
+    # checkout got there first and every order in this job is rolled back.
+    # shops.total_sales and products.sales_count are maintained by triggers.
+    decrements = [(quantity, quantity, product_id, quantity)
+                  for shop_id in shop_ids for product_id, quantity, _, _ in lines[shop_id]]
+    cursor.executemany('''
+        UPDATE products 
+        SET stock_quantity = stock_quantity - ?, 
+            is_in_stock = CASE WHEN stock_quantity - ? > 0 THEN 1 ELSE 0 END
+        WHERE id = ? AND stock_quantity >= ?
+    ''', decrements)
+    if cursor.rowcount != len(decrements):
+        raise ApiError('Insufficient stock for one or more products', 409)
+    
+    # Create payment records
+    cursor.executemany('''
+        INSERT INTO payments (order_id, provider, amount, currency, status)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(order_ids[shop_id], payment_method, totals[shop_id], 'USD', 'pending') for shop_id in shop_ids])
+    
+    # Get created orders with items
+    ids = list(order_ids.values())
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute(f'SELECT * FROM orders WHERE id IN ({placeholders}) ORDER BY id', ids)
+    orders = [dict(row) for row in cursor.fetchall()]
+    
+    cursor.execute(f'''
+        SELECT oi.*, p.name, p.image_url
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN ({placeholders})
+    ''', ids)
+    items = {}
+    for row in cursor.fetchall():
+        items.setdefault(row['order_id'], []).append(dict(row))
+    for order in orders:
+        order['items'] = items.get(order['id'], [])
+    
+    return orders
+
+def _place_order(conn, user_id, shop_id, items, payment_method, shipping_address):
+    """Validate, reserve stock and create one order; runs as a single writer job"""
+    try:
+        shop_id = int(shop_id)
+    except (TypeError, ValueError):
+        raise ApiError('Shop not found', 404)
+    quantities = _merge_quantities(items)
+    return _create_orders(conn.cursor(), user_id, {shop_id: quantities}, payment_method, shipping_address)[0]
+
+def _checkout_cart(conn, user_id, payment_method, shipping_address):
+    """Turn the user's cart into one order per shop and empty it; runs as a single writer job"""
+    cursor = conn.cursor()
+    
+    # Same rows get_cart shows, grouped by the shop that sells them
+    cursor.execute('''
+        SELECT ci.product_id, ci.quantity, p.shop_id
+        FROM cart_items ci
+        JOIN products p ON ci.product_id = p.id
+        WHERE ci.user_id = ? AND p.is_available = 1
+        ORDER BY ci.created_at
+    ''', (user_id,))
+    shop_quantities = {}
+    for row in cursor.fetchall():
+        quantities = shop_quantities.setdefault(row['shop_id'], {})
+        quantities[row['product_id']] = quantities.get(row['product_id'], 0) + row['quantity']
+    
+    if not shop_quantities:
+        raise ApiError('Cart is empty')
+    
+    orders = _create_orders(cursor, user_id, shop_quantities, payment_method, shipping_address)
+    
+    cursor.execute('DELETE FROM cart_items WHERE user_id = ?', (user_id,))
+    
+    return orders
+
 @orders_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     try:
         user_id = int(get_jwt_identity())
@@ -20,100 +167,34 @@ def create_order():
         if not shop_id or not items:
             return jsonify(standard_response('error', 'Shop ID and items are required')), 400
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Verify shop exists
-        cursor.execute('SELECT id FROM shops WHERE id = ? AND is_active = 1', (shop_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Shop not found')), 404
-        
-        # Calculate total and verify stock
-        total_amount = 0
-        order_items_data = []
+        # Checks, inserts and stock decrements commit together under BEGIN IMMEDIATE
+        order_dict = writer.run(_place_order, user_id, shop_id, items, payment_method, shipping_address)
         
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = int(item.get('quantity', 1))
-            
-            cursor.execute('SELECT price, stock_quantity, is_available FROM products WHERE id = ? AND shop_id = ?', 
-                          (product_id, shop_id))
-            product = cursor.fetchone()
-            
-            if not product or not product['is_available']:
-                conn.close()
-                return jsonify(standard_response('error', f'Product {product_id} not available')), 400
-            
-            if product['stock_quantity'] < quantity:
-                conn.close()
-                return jsonify(standard_response('error', f'Insufficient stock for product {product_id}')), 400
-            
-            unit_price = product['price']
-            subtotal = unit_price * quantity
-            total_amount += subtotal
-            order_items_data.append({
-                'product_id': product_id,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'subtotal': subtotal
-            })
-        
-        # Create order
-        cursor.execute('''
-            INSERT INTO orders (user_id, shop_id, status, total_amount, currency, payment_method, shipping_address)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, shop_id, 'pending', total_amount, 'USD', payment_method, shipping_address))
-        
-        order_id = cursor.lastrowid
-        
-        # Create order items and update stock
-        for item_data in order_items_data:
-            cursor.execute('''
-                INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (order_id, item_data['product_id'], item_data['quantity'], 
-                  item_data['unit_price'], item_data['subtotal']))
-            
-            # Update product stock
-            cursor.execute('''
-                UPDATE products 
-                SET stock_quantity = stock_quantity - ?, 
-                    sales_count = sales_count + ?,
-                    is_in_stock = CASE WHEN stock_quantity - ? > 0 THEN 1 ELSE 0 END
-                WHERE id = ?
-            ''', (item_data['quantity'], item_data['quantity'], item_data['quantity'], item_data['product_id']))
-        
-        # Update shop total sales
-        cursor.execute('UPDATE shops SET total_sales = total_sales + ? WHERE id = ?', (total_amount, shop_id))
-        
-        # Create payment record
-        cursor.execute('''
-            INSERT INTO payments (order_id, provider, amount, currency, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (order_id, payment_method, total_amount, 'USD', 'pending'))
-        
-        conn.commit()
-        
-        # Get created order with items
-        cursor.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
-        order = cursor.fetchone()
+        return jsonify(standard_response('success', 'Order created', order_dict)), 201
         
-        cursor.execute('''
-            SELECT oi.*, p.name, p.image_url
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        ''', (order_id,))
-        order_items = [dict(row) for row in cursor.fetchall()]
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@orders_bp.route('/checkout', methods=['POST'])
+@jwt_required()
+@idempotent
+def checkout():
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
         
-        conn.close()
+        payment_method = data.get('payment_method', 'cash')
+        shipping_address = data.get('shipping_address')
         
-        order_dict = dict(order)
-        order_dict['items'] = order_items
+        # All shops' orders, payments and the emptied cart commit together
+        orders = writer.run(_checkout_cart, user_id, payment_method, shipping_address)
         
-        return jsonify(standard_response('success', 'Order created', order_dict)), 201
+        return jsonify(standard_response('success', 'Checkout complete', orders)), 201
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -129,9 +210,7 @@ def get_orders():
         
         if shop_id:
             # Verify shop ownership
-            cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-            shop = cursor.fetchone()
-            if not shop or shop['owner_id'] != user_id:
+            if not owns_shop(cursor, shop_id, user_id):
                 conn.close()
                 return jsonify(standard_response('error', 'Unauthorized')), 403
             
@@ -164,9 +243,7 @@ def get_order(order_id):
         
         # Verify access (user or shop owner)
         if order['user_id'] != user_id:
-            cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (order['shop_id'],))
-            shop = cursor.fetchone()
-            if not shop or shop['owner_id'] != user_id:
+            if not owns_shop(cursor, order['shop_id'], user_id):
                 conn.close()
                 return jsonify(standard_response('error', 'Unauthorized')), 403
         
@@ -209,9 +286,7 @@ def update_order_status(order_id):
             return jsonify(standard_response('error', 'Order not found')), 404
         
         # Verify shop ownership
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (order['shop_id'],))
-        shop = cursor.fetchone()
-        if not shop or shop['owner_id'] != user_id:
+        if not owns_shop(cursor, order['shop_id'], user_id):
             conn.close()
             return jsonify(standard_response('error', 'Unauthorized')), 403
         
@@ -1,23 +1,31 @@
 from flask import Blueprint, request, jsonify, send_from_directory
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
-from database import get_db
-from utils import standard_response, generate_slug
+from authz import product_shop, require_shop_owner
+from database import get_db, read_only
+import http_cache
+from view_counter import view_counter
+from slugs import write_with_slug
+from utils import standard_response, ApiError, decode_cursor, page_limit, paginate
+import html
 import os
+import re
 import uuid
 
 products_bp = Blueprint('products', __name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', 8))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @products_bp.route('', methods=['POST'])
 @jwt_required()
+@require_shop_owner(json_field='shop_id', forbidden='Unauthorized or shop not found')
 def create_product():
     try:
-        user_id = int(get_jwt_identity())
         data = request.get_json()
         
         shop_id = data.get('shop_id')
@@ -27,24 +35,8 @@ def create_product():
         if not shop_id or not name or price is None:
             return jsonify(standard_response('error', 'Shop ID, name, and price are required')), 400
         
-        # Verify shop ownership
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-        shop = cursor.fetchone()
-        if not shop or shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized or shop not found')), 403
-        
-        slug = generate_slug(name)
-        base_slug = slug
-        counter = 1
-        while True:
-            cursor.execute('SELECT id FROM products WHERE slug = ? AND shop_id = ?', (slug, shop_id))
-            if not cursor.fetchone():
-                break
-            slug = f"{base_slug}-{counter}"
-            counter += 1
         
         # Calculate discount if original_price provided
         original_price = data.get('original_price')
@@ -52,7 +44,8 @@ def create_product():
         if original_price and original_price > price:
             discount_percentage = ((original_price - price) / original_price) * 100
         
-        cursor.execute('''
+        # Insert under a slug unique within the shop, retried if a concurrent request takes it first
+        write_with_slug(cursor, 'products', name, lambda slug: cursor.execute('''
             INSERT INTO products (shop_id, name, slug, description, price, original_price, discount_percentage,
                                  stock_quantity, min_order_quantity, max_order_quantity, sku, barcode, weight,
                                  dimensions, category, tags, is_available, is_in_stock, is_featured)
@@ -63,13 +56,10 @@ def create_product():
             data.get('sku'), data.get('barcode'), data.get('weight'), data.get('dimensions'),
             data.get('category'), data.get('tags'), data.get('is_available', 1),
             1 if data.get('stock_quantity', 0) > 0 else 0, data.get('is_featured', 0)
-        ))
+        )), scope_id=shop_id)
         
         product_id = cursor.lastrowid
         
-        # Update shop product count
-        cursor.execute('UPDATE shops SET product_count = product_count + 1 WHERE id = ?', (shop_id,))
-        
         conn.commit()
         
         cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
@@ -81,53 +71,154 @@ def create_product():
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
+def _match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = re.findall(r'\w+', text.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    # Quoting keeps FTS5 operators and syntax in user input from being interpreted
+    expression = ' '.join(f'"{term}"' for term in terms)
+    if len(terms[-1]) >= 2:
+        expression += '*'
+    return expression
+
+def _highlight(snippet):
+    """Escape a snippet for HTML and turn the FTS match markers into <mark> tags"""
+    return html.escape(snippet or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ApiError(f'{name} must be a number')
+
+@products_bp.route('/search', methods=['GET'])
+@read_only
+def search_products():
+    try:
+        match = _match_expression(request.args.get('q', ''))
+        if not match:
+            return jsonify(standard_response('error', 'Search query is required')), 400
+        
+        min_price = _float_arg('min_price')
+        max_price = _float_arg('max_price')
+        shop_id = request.args.get('shop_id', type=int)
+        in_stock = request.args.get('in_stock') in ('1', 'true')
+        limit = page_limit(request.args.get('limit'))
+        after = request.args.get('cursor')
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # rank is bm25 with the column weights configured in migration 0008
+        query = '''
+            SELECT p.id, p.shop_id, p.name, p.slug, p.price, p.original_price, p.discount_percentage,
+                   p.image_url, p.category, p.is_in_stock, p.rating, p.reviews_count,
+                   s.name AS shop_name, s.slug AS shop_slug,
+                   snippet(products_fts, -1, char(2), char(3), '…', 16) AS snippet,
+                   products_fts.rank AS rank
+            FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            JOIN shops s ON s.id = p.shop_id
+            WHERE products_fts MATCH ? AND p.is_available = 1 AND s.is_active = 1
+        '''
+        params = [match]
+        
+        if min_price is not None:
+            query += ' AND p.price >= ?'
+            params.append(min_price)
+        
+        if max_price is not None:
+            query += ' AND p.price <= ?'
+            params.append(max_price)
+        
+        if in_stock:
+            query += ' AND p.is_in_stock = 1'
+        
+        if shop_id:
+            query += ' AND p.shop_id = ?'
+            params.append(shop_id)
+        
+        if after:
+            query += ' AND (products_fts.rank, p.id) > (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY products_fts.rank, p.id LIMIT ?'
+        params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        products, pagination = paginate(cursor.fetchall(), limit, 'rank', 'id')
+        conn.close()
+        
+        for product in products:
+            product['snippet'] = _highlight(product['snippet'])
+        
+        return jsonify(standard_response('success', 'Search results', products, pagination=pagination)), 200
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@read_only
 def get_product(product_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
+        # Validators follow the shop's catalog version, bumped by any change to its products;
+        # no row means the product is missing or deleted
+        cursor.execute('''
+            SELECT v.version, v.changed_at FROM products p
+            LEFT JOIN cache_versions v ON v.key = 'catalog:' || p.shop_id
+            WHERE p.id = ? AND p.is_available = 1
+        ''', (product_id,))
+        stamp = cursor.fetchone()
+        if not stamp:
+            conn.close()
+            return jsonify(standard_response('error', 'Product not found')), 404
+        
+        version, changed_at = stamp
+        if version is not None:
+            etag, last_modified = http_cache.validators(f'product:{product_id}', version, changed_at)
+            if http_cache.is_fresh(etag, last_modified):
+                conn.close()
+                view_counter.add('products', product_id)
+                return http_cache.not_modified(etag, last_modified)
+        
         cursor.execute('SELECT * FROM products WHERE id = ? AND is_available = 1', (product_id,))
         product = cursor.fetchone()
         
-        if product:
-            # Increment views
-            cursor.execute('UPDATE products SET views_count = views_count + 1 WHERE id = ?', (product_id,))
-            conn.commit()
-        
         conn.close()
         
         if not product:
             return jsonify(standard_response('error', 'Product not found')), 404
         
-        return jsonify(standard_response('success', 'Product retrieved', dict(product))), 200
+        # Views are buffered in memory and written in batches
+        view_counter.add('products', product_id)
+        
+        response = jsonify(standard_response('success', 'Product retrieved', dict(product)))
+        if version is not None:
+            http_cache.with_validators(response, etag, last_modified)
+        return response, 200
         
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
 @products_bp.route('/<int:product_id>', methods=['PUT'])
 @jwt_required()
+@require_shop_owner(product_arg='product_id')
 def update_product(product_id):
     try:
-        user_id = int(get_jwt_identity())
         data = request.get_json()
         
         conn = get_db()
         cursor = conn.cursor()
         
-        # Get product and verify ownership
-        cursor.execute('SELECT shop_id FROM products WHERE id = ?', (product_id,))
-        product = cursor.fetchone()
-        if not product:
-            conn.close()
-            return jsonify(standard_response('error', 'Product not found')), 404
-        
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (product['shop_id'],))
-        shop = cursor.fetchone()
-        if shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        
         # Build update query
         updates = []
         values = []
@@ -162,26 +253,20 @@ def update_product(product_id):
             values.append(1 if data['stock_quantity'] > 0 else 0)
         
         if 'name' in data:
-            slug = generate_slug(data['name'])
-            base_slug = slug
-            counter = 1
-            while True:
-                cursor.execute('SELECT id FROM products WHERE slug = ? AND shop_id = ? AND id != ?', 
-                             (slug, product['shop_id'], product_id))
-                if not cursor.fetchone():
-                    break
-                slug = f"{base_slug}-{counter}"
-                counter += 1
+            # The new slug is allocated as the row is written
             updates.append('slug = ?')
-            values.append(slug)
         
         if not updates:
             conn.close()
             return jsonify(standard_response('error', 'No valid fields to update')), 400
         
-        values.append(product_id)
         query = f"UPDATE products SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
-        cursor.execute(query, values)
+        if 'name' in data:
+            write_with_slug(cursor, 'products', data['name'],
+                            lambda slug: cursor.execute(query, values + [slug, product_id]),
+                            scope_id=product_shop(cursor, product_id), exclude_id=product_id)
+        else:
+            cursor.execute(query, values + [product_id])
         conn.commit()
         
         cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
@@ -195,28 +280,15 @@ def update_product(product_id):
 
 @products_bp.route('/<int:product_id>', methods=['DELETE'])
 @jwt_required()
+@require_shop_owner(product_arg='product_id')
 def delete_product(product_id):
     try:
-        user_id = int(get_jwt_identity())
-        
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT shop_id FROM products WHERE id = ?', (product_id,))
-        product = cursor.fetchone()
-        if not product:
-            conn.close()
-            return jsonify(standard_response('error', 'Product not found')), 404
-        
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (product['shop_id'],))
-        shop = cursor.fetchone()
-        if shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        
-        # Soft delete
-        cursor.execute('UPDATE products SET is_available = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?', (product_id,))
-        cursor.execute('UPDATE shops SET product_count = product_count - 1 WHERE id = ?', (product['shop_id'],))
+        # Soft delete; a trigger moves product_count only if it was still available
+        cursor.execute('UPDATE products SET is_available = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND is_available = 1',
+                      (product_id,))
         conn.commit()
         conn.close()
         
@@ -227,25 +299,9 @@ def delete_product(product_id):
 
 @products_bp.route('/<int:product_id>/upload-image', methods=['POST'])
 @jwt_required()
+@require_shop_owner(product_arg='product_id')
 def upload_product_image(product_id):
     try:
-        user_id = int(get_jwt_identity())
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT shop_id FROM products WHERE id = ?', (product_id,))
-        product = cursor.fetchone()
-        if not product:
-            conn.close()
-            return jsonify(standard_response('error', 'Product not found')), 404
-        
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (product['shop_id'],))
-        shop = cursor.fetchone()
-        if shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        conn.close()
-        
         if 'file' not in request.files:
             return jsonify(standard_response('error', 'No file provided')), 400
         
@@ -1,12 +1,93 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from database import get_db
-from utils import standard_response
+from database import get_db, read_only
+from utils import standard_response, ApiError, decode_cursor, page_limit, paginate
+from writer import writer
+from idempotency import idempotent
 
 reviews_bp = Blueprint('reviews', __name__)
 
+def _rating_summary(row):
+    return {
+        'rating': round(row['rating_sum'] / row['rating_count'], 2) if row['rating_count'] else 0,
+        'rating_count': row['rating_count'],
+        'distribution': {str(stars): row[f'rating_{stars}'] for stars in range(1, 6)}
+    }
+
+# sort name: (keyset columns, direction); each is served by an (entity, column, created_at) index
+REVIEW_SORTS = {
+    'newest': (('created_at', 'id'), 'DESC'),
+    'highest': (('rating', 'created_at', 'id'), 'DESC'),
+    'lowest': (('rating', 'created_at', 'id'), 'ASC'),
+    'verified': (('is_verified_purchase', 'created_at', 'id'), 'DESC'),
+}
+
+def _list_reviews(cursor, reviews_table, key, entity_table, entity_id):
+    """One page of reviews in the requested sort; the first page also carries the rating summary"""
+    sort = request.args.get('sort', 'newest')
+    if sort not in REVIEW_SORTS:
+        raise ApiError(f"sort must be one of {', '.join(REVIEW_SORTS)}")
+    columns, direction = REVIEW_SORTS[sort]
+    limit = page_limit(request.args.get('limit'))
+    after = request.args.get('cursor')
+    
+    summary = None
+    if not after:
+        # Served from the stored aggregate, so clients never need the full list
+        cursor.execute(f'''
+            SELECT rating_sum, rating_count, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM {entity_table} WHERE id = ?
+        ''', (entity_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise ApiError(f'{entity_table[:-1].capitalize()} not found', 404)
+        summary = _rating_summary(row)
+    
+    query = f'''
+        SELECT r.*, u.full_name, u.profile_photo
+        FROM {reviews_table} r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.{key} = ?
+    '''
+    params = [entity_id]
+    
+    # Keyset pagination on the sort columns: every page is an index range read
+    if after:
+        keyset = ', '.join(f'r.{column}' for column in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        query += f" AND ({keyset}) {'<' if direction == 'DESC' else '>'} ({placeholders})"
+        params.extend(decode_cursor(after, len(columns)))
+    
+    query += ' ORDER BY ' + ', '.join(f'r.{column} {direction}' for column in columns) + ' LIMIT ?'
+    params.append(limit + 1)
+    
+    cursor.execute(query, params)
+    reviews, pagination = paginate(cursor.fetchall(), limit, *columns)
+    return reviews, pagination, summary
+
+def _create_shop_review(conn, shop_id, user_id, rating, data):
+    cursor = conn.cursor()
+    
+    # Verify shop exists
+    cursor.execute('SELECT id FROM shops WHERE id = ?', (shop_id,))
+    if not cursor.fetchone():
+        raise ApiError('Shop not found', 404)
+    
+    # Check if already reviewed
+    cursor.execute('SELECT id FROM shop_reviews WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
+    if cursor.fetchone():
+        raise ApiError('Already reviewed')
+    
+    # reviews_count and the rating aggregate are maintained by a trigger
+    cursor.execute('''
+        INSERT INTO shop_reviews (shop_id, user_id, rating, title, body, is_verified_purchase)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (shop_id, user_id, rating, data.get('title'), data.get('body'),
+          1 if data.get('is_verified_purchase') else 0))
+
 @reviews_bp.route('/shop/<int:shop_id>', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_shop_review(shop_id):
     try:
         user_id = int(get_jwt_identity())
@@ -16,65 +97,56 @@ def create_shop_review(shop_id):
         if rating < 1 or rating > 5:
             return jsonify(standard_response('error', 'Rating must be between 1 and 5')), 400
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Verify shop exists
-        cursor.execute('SELECT id FROM shops WHERE id = ?', (shop_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Shop not found')), 404
-        
-        # Check if already reviewed
-        cursor.execute('SELECT id FROM shop_reviews WHERE shop_id = ? AND user_id = ?', (shop_id, user_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Already reviewed')), 400
-        
-        cursor.execute('''
-            INSERT INTO shop_reviews (shop_id, user_id, rating, title, body, is_verified_purchase)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (shop_id, user_id, rating, data.get('title'), data.get('body'), data.get('is_verified_purchase', 0)))
-        
-        # Update shop rating
-        cursor.execute('''
-            UPDATE shops 
-            SET reviews_count = reviews_count + 1,
-                rating = (SELECT AVG(rating) FROM shop_reviews WHERE shop_id = ?)
-            WHERE id = ?
-        ''', (shop_id, shop_id))
-        
-        conn.commit()
-        conn.close()
+        writer.run(_create_shop_review, shop_id, user_id, rating, data)
         
         return jsonify(standard_response('success', 'Review created')), 201
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
 @reviews_bp.route('/shop/<int:shop_id>', methods=['GET'])
+@read_only
 def get_shop_reviews(shop_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT sr.*, u.full_name, u.profile_photo
-            FROM shop_reviews sr
-            JOIN users u ON sr.user_id = u.id
-            WHERE sr.shop_id = ?
-            ORDER BY sr.created_at DESC
-        ''', (shop_id,))
-        reviews = [dict(row) for row in cursor.fetchall()]
+        reviews, pagination, summary = _list_reviews(cursor, 'shop_reviews', 'shop_id', 'shops', shop_id)
         conn.close()
         
-        return jsonify(standard_response('success', 'Reviews retrieved', reviews)), 200
+        return jsonify(standard_response('success', 'Reviews retrieved', reviews,
+                                         pagination=pagination, summary=summary)), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
+def _create_product_review(conn, product_id, user_id, rating, data):
+    cursor = conn.cursor()
+    
+    # Verify product exists
+    cursor.execute('SELECT id FROM products WHERE id = ?', (product_id,))
+    if not cursor.fetchone():
+        raise ApiError('Product not found', 404)
+    
+    # Check if already reviewed
+    cursor.execute('SELECT id FROM product_reviews WHERE product_id = ? AND user_id = ?', (product_id, user_id))
+    if cursor.fetchone():
+        raise ApiError('Already reviewed')
+    
+    # reviews_count and the rating aggregate are maintained by a trigger
+    cursor.execute('''
+        INSERT INTO product_reviews (product_id, user_id, rating, title, body, is_verified_purchase)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (product_id, user_id, rating, data.get('title'), data.get('body'),
+          1 if data.get('is_verified_purchase') else 0))
+
 @reviews_bp.route('/product/<int:product_id>', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_product_review(product_id):
     try:
         user_id = int(get_jwt_identity())
@@ -84,60 +156,75 @@ def create_product_review(product_id):
         if rating < 1 or rating > 5:
             return jsonify(standard_response('error', 'Rating must be between 1 and 5')), 400
         
+        writer.run(_create_product_review, product_id, user_id, rating, data)
+        
+        return jsonify(standard_response('success', 'Review created')), 201
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@reviews_bp.route('/product/<int:product_id>', methods=['GET'])
+@read_only
+def get_product_reviews(product_id):
+    try:
         conn = get_db()
         cursor = conn.cursor()
         
-        # Verify product exists
-        cursor.execute('SELECT id FROM products WHERE id = ?', (product_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Product not found')), 404
+        reviews, pagination, summary = _list_reviews(cursor, 'product_reviews', 'product_id', 'products', product_id)
+        conn.close()
         
-        # Check if already reviewed
-        cursor.execute('SELECT id FROM product_reviews WHERE product_id = ? AND user_id = ?', (product_id, user_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify(standard_response('error', 'Already reviewed')), 400
+        return jsonify(standard_response('success', 'Reviews retrieved', reviews,
+                                         pagination=pagination, summary=summary)), 200
         
-        cursor.execute('''
-            INSERT INTO product_reviews (product_id, user_id, rating, title, body, is_verified_purchase)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (product_id, user_id, rating, data.get('title'), data.get('body'), data.get('is_verified_purchase', 0)))
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@reviews_bp.route('/shop/<int:shop_id>/summary', methods=['GET'])
+@read_only
+def get_shop_review_summary(shop_id):
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
         
-        # Update product rating
+        # Served from the stored aggregate, no review rows are read
         cursor.execute('''
-            UPDATE products 
-            SET reviews_count = reviews_count + 1,
-                rating = (SELECT AVG(rating) FROM product_reviews WHERE product_id = ?)
-            WHERE id = ?
-        ''', (product_id, product_id))
-        
-        conn.commit()
+            SELECT rating_sum, rating_count, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM shops WHERE id = ?
+        ''', (shop_id,))
+        row = cursor.fetchone()
         conn.close()
         
-        return jsonify(standard_response('success', 'Review created')), 201
+        if not row:
+            return jsonify(standard_response('error', 'Shop not found')), 404
+        
+        return jsonify(standard_response('success', 'Review summary retrieved', _rating_summary(row))), 200
         
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
-@reviews_bp.route('/product/<int:product_id>', methods=['GET'])
-def get_product_reviews(product_id):
+@reviews_bp.route('/product/<int:product_id>/summary', methods=['GET'])
+@read_only
+def get_product_review_summary(product_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
+        # Served from the stored aggregate, no review rows are read
         cursor.execute('''
-            SELECT pr.*, u.full_name, u.profile_photo
-            FROM product_reviews pr
-            JOIN users u ON pr.user_id = u.id
-            WHERE pr.product_id = ?
-            ORDER BY pr.created_at DESC
+            SELECT rating_sum, rating_count, rating_1, rating_2, rating_3, rating_4, rating_5
+            FROM products WHERE id = ?
         ''', (product_id,))
-        reviews = [dict(row) for row in cursor.fetchall()]
+        row = cursor.fetchone()
         conn.close()
         
-        return jsonify(standard_response('success', 'Reviews retrieved', reviews)), 200
+        if not row:
+            return jsonify(standard_response('error', 'Product not found')), 404
+        
+        return jsonify(standard_response('success', 'Review summary retrieved', _rating_summary(row))), 200
         
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
-
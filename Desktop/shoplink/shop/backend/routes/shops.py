@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, current_app, request, jsonify, send_from_directory
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from database import get_db
-from utils import standard_response, generate_slug
+from authz import require_shop_owner
+from cache import catalog_cache, catalog_key, shop_cache, shop_key
+from database import cached_query, get_db, read_only
+import geo
+import http_cache
+from slugs import write_with_slug
+from utils import standard_response, spliced_response, ApiError, decode_cursor, page_limit, paginate
 import os
 import uuid
 
@@ -24,20 +29,11 @@ def create_shop():
         if not name:
             return jsonify(standard_response('error', 'Shop name is required')), 400
         
-        slug = generate_slug(name)
-        # Ensure unique slug
         conn = get_db()
         cursor = conn.cursor()
-        base_slug = slug
-        counter = 1
-        while True:
-            cursor.execute('SELECT id FROM shops WHERE slug = ?', (slug,))
-            if not cursor.fetchone():
-                break
-            slug = f"{base_slug}-{counter}"
-            counter += 1
         
-        cursor.execute('''
+        # Insert under a unique slug, retried if a concurrent request takes it first
+        write_with_slug(cursor, 'shops', name, lambda slug: cursor.execute('''
             INSERT INTO shops (owner_id, name, slug, category, description, location, address, city, state, country,
                              latitude, longitude, phone, email, website, business_hours, is_online_selling,
                              is_offline_selling, accepts_online_payment, accepts_cash)
@@ -48,7 +44,7 @@ def create_shop():
             data.get('latitude'), data.get('longitude'), data.get('phone'), data.get('email'),
             data.get('website'), data.get('business_hours'), data.get('is_online_selling', 1),
             data.get('is_offline_selling', 0), data.get('accepts_online_payment', 1), data.get('accepts_cash', 1)
-        ))
+        )))
         
         shop_id = cursor.lastrowid
         conn.commit()
@@ -63,28 +59,59 @@ def create_shop():
         return jsonify(standard_response('error', str(e))), 500
 
 @shops_bp.route('/<int:shop_id>', methods=['GET'])
+@read_only
 def get_shop(shop_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM shops WHERE id = ? AND is_active = 1', (shop_id,))
-        shop = cursor.fetchone()
+        # One indexed lookup finds the version stamp of an active shop; no row means 404
+        key = shop_key(shop_id)
+        cursor.execute('''
+            SELECT v.version, v.changed_at FROM shops s
+            LEFT JOIN cache_versions v ON v.key = 'shop:' || s.id
+            WHERE s.id = ? AND s.is_active = 1
+        ''', (shop_id,))
+        stamp = cursor.fetchone()
+        if not stamp:
+            conn.close()
+            return jsonify(standard_response('error', 'Shop not found')), 404
+        
+        version, changed_at = stamp
+        if version is not None:
+            etag, last_modified = http_cache.validators(key, version, changed_at)
+            if http_cache.is_fresh(etag, last_modified):
+                conn.close()
+                return http_cache.not_modified(etag, last_modified)
+        
+        # Serve from the worker's cache while the shop's version stamp is unchanged
+        shop = shop_cache.get(key, version or 0)
+        if shop is None:
+            cursor.execute('SELECT * FROM shops WHERE id = ? AND is_active = 1', (shop_id,))
+            row = cursor.fetchone()
+            if row:
+                shop = dict(row)
+                shop_cache.set(key, version or 0, shop)
         conn.close()
         
         if not shop:
             return jsonify(standard_response('error', 'Shop not found')), 404
         
-        return jsonify(standard_response('success', 'Shop retrieved', dict(shop))), 200
+        response = jsonify(standard_response('success', 'Shop retrieved', shop))
+        if version is not None:
+            http_cache.with_validators(response, etag, last_modified)
+        return response, 200
         
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
 @shops_bp.route('', methods=['GET'])
+@read_only
 def list_shops():
     try:
         category = request.args.get('category')
-        limit = int(request.args.get('limit', 20))
+        limit = page_limit(request.args.get('limit'))
+        after = request.args.get('cursor')
         offset = int(request.args.get('offset', 0))
         
         conn = get_db()
@@ -97,39 +124,93 @@ def list_shops():
             query += ' AND category = ?'
             params.append(category)
         
-        query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        # Keyset pagination on (created_at, id): every page is an index range read
+        if after:
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        # offset is still accepted for older clients, but skips rows one by one
+        if offset and not after:
+            query += ' OFFSET ?'
+            params.append(offset)
+        
+        # Category listings repeat verbatim; cached until a shop changes
+        shops, pagination = paginate(cached_query(cursor, query, params), limit, 'created_at', 'id')
+        conn.close()
+        
+        response = jsonify(standard_response('success', 'Shops retrieved', shops, pagination=pagination))
+        return http_cache.with_policy(response, 'list'), 200
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
+    except Exception as e:
+        return jsonify(standard_response('error', str(e))), 500
+
+@shops_bp.route('/nearby', methods=['GET'])
+@read_only
+def nearby_shops():
+    try:
+        lat, lng, radius_km = geo.search_args(request.args)
+        category = request.args.get('category')
+        limit = page_limit(request.args.get('limit'))
+        after = request.args.get('cursor')
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius_km)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        # The R*Tree prefilters to the bounding box and haversine_km refines to the
+        # circle. LIMIT -1 keeps the candidates materialized, so the distance is
+        # computed once per candidate and only (distance, id) pairs are sorted.
+        query = '''
+            SELECT s.*, candidates.distance_km
+            FROM (
+                SELECT id, haversine_km(?, ?, min_lat, min_lng) AS distance_km FROM shops_geo
+                WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ? LIMIT -1
+            ) candidates
+            JOIN shops s ON s.id = candidates.id
+            WHERE s.is_active = 1 AND candidates.distance_km <= ?
+        '''
+        params = [lat, lng, min_lat, max_lat, min_lng, max_lng, radius_km]
+        
+        if category:
+            query += ' AND s.category = ?'
+            params.append(category)
+        
+        if after:
+            query += ' AND (candidates.distance_km, s.id) > (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY candidates.distance_km, s.id LIMIT ?'
+        params.append(limit + 1)
         
         cursor.execute(query, params)
-        shops = [dict(row) for row in cursor.fetchall()]
+        shops, pagination = paginate(cursor.fetchall(), limit, 'distance_km', 'id')
         conn.close()
         
-        return jsonify(standard_response('success', 'Shops retrieved', shops)), 200
+        for row in shops:
+            row['distance_km'] = round(row['distance_km'], 3)
         
+        return jsonify(standard_response('success', 'Nearby shops retrieved', shops, pagination=pagination)), 200
+        
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
 @shops_bp.route('/<int:shop_id>', methods=['PUT'])
 @jwt_required()
+@require_shop_owner(not_found='Shop not found')
 def update_shop(shop_id):
     try:
-        user_id = int(get_jwt_identity())
         data = request.get_json()
         
         conn = get_db()
         cursor = conn.cursor()
         
-        # Check ownership
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-        shop = cursor.fetchone()
-        if not shop:
-            conn.close()
-            return jsonify(standard_response('error', 'Shop not found')), 404
-        
-        if shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        
         # Build update query
         updates = []
         values = []
@@ -144,26 +225,19 @@ def update_shop(shop_id):
                 values.append(data[field])
         
         if 'name' in data:
-            # Regenerate slug if name changed
-            slug = generate_slug(data['name'])
-            base_slug = slug
-            counter = 1
-            while True:
-                cursor.execute('SELECT id FROM shops WHERE slug = ? AND id != ?', (slug, shop_id))
-                if not cursor.fetchone():
-                    break
-                slug = f"{base_slug}-{counter}"
-                counter += 1
+            # Regenerate slug if name changed; it is allocated as the row is written
             updates.append('slug = ?')
-            values.append(slug)
         
         if not updates:
             conn.close()
             return jsonify(standard_response('error', 'No valid fields to update')), 400
         
-        values.append(shop_id)
         query = f"UPDATE shops SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
-        cursor.execute(query, values)
+        if 'name' in data:
+            write_with_slug(cursor, 'shops', data['name'], lambda slug: cursor.execute(query, values + [slug, shop_id]),
+                            exclude_id=shop_id)
+        else:
+            cursor.execute(query, values + [shop_id])
         conn.commit()
         
         cursor.execute('SELECT * FROM shops WHERE id = ?', (shop_id,))
@@ -177,19 +251,9 @@ def update_shop(shop_id):
 
 @shops_bp.route('/<int:shop_id>/upload-logo', methods=['POST'])
 @jwt_required()
+@require_shop_owner()
 def upload_logo(shop_id):
     try:
-        user_id = int(get_jwt_identity())
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-        shop = cursor.fetchone()
-        if not shop or shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        conn.close()
-        
         if 'file' not in request.files:
             return jsonify(standard_response('error', 'No file provided')), 400
         
@@ -218,19 +282,9 @@ def upload_logo(shop_id):
 
 @shops_bp.route('/<int:shop_id>/upload-cover', methods=['POST'])
 @jwt_required()
+@require_shop_owner()
 def upload_cover(shop_id):
     try:
-        user_id = int(get_jwt_identity())
-        
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT owner_id FROM shops WHERE id = ?', (shop_id,))
-        shop = cursor.fetchone()
-        if not shop or shop['owner_id'] != user_id:
-            conn.close()
-            return jsonify(standard_response('error', 'Unauthorized')), 403
-        conn.close()
-        
         if 'file' not in request.files:
             return jsonify(standard_response('error', 'No file provided')), 400
         
@@ -258,17 +312,57 @@ def upload_cover(shop_id):
         return jsonify(standard_response('error', str(e))), 500
 
 @shops_bp.route('/<int:shop_id>/products', methods=['GET'])
+@read_only
 def get_shop_products(shop_id):
     try:
+        limit = page_limit(request.args.get('limit'), default=50)
+        after = request.args.get('cursor')
+        
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM products WHERE shop_id = ? AND is_available = 1 ORDER BY created_at DESC', (shop_id,))
-        products = [dict(row) for row in cursor.fetchall()]
+        query = 'SELECT * FROM products WHERE shop_id = ? AND is_available = 1'
+        params = [shop_id]
+        
+        if after:
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        # An unchanged catalog is one version lookup plus the cached, already encoded page;
+        # the lookup goes through the active shop row, so no row means 404
+        key = (shop_id, limit, after)
+        cursor.execute('''
+            SELECT v.version, v.changed_at FROM shops s
+            LEFT JOIN cache_versions v ON v.key = 'catalog:' || s.id
+            WHERE s.id = ? AND s.is_active = 1
+        ''', (shop_id,))
+        stamp = cursor.fetchone()
+        if not stamp:
+            conn.close()
+            return jsonify(standard_response('error', 'Shop not found')), 404
+        
+        version, changed_at = stamp[0] or 0, stamp[1]
+        etag, last_modified = http_cache.validators(catalog_key(shop_id), version, changed_at)
+        if http_cache.is_fresh(etag, last_modified):
+            conn.close()
+            return http_cache.not_modified(etag, last_modified)
+        
+        page = catalog_cache.get(key, version)
+        if page is None:
+            cursor.execute(query, params)
+            products, pagination = paginate(cursor.fetchall(), limit, 'created_at', 'id')
+            page = (current_app.json.dumps(products, separators=(',', ':')).encode(), pagination)
+            catalog_cache.set(key, version, page, len(page[0]))
         conn.close()
         
-        return jsonify(standard_response('success', 'Products retrieved', products)), 200
+        response = spliced_response('success', 'Products retrieved', page[0], pagination=page[1])
+        return http_cache.with_validators(response, etag, last_modified)
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from database import get_db
-from utils import standard_response
+from utils import standard_response, ApiError, decode_cursor, page_limit, paginate
 
 users_bp = Blueprint('users', __name__)
 
@@ -77,22 +77,37 @@ def update_profile():
 def get_user_shops():
     try:
         user_id = int(get_jwt_identity())
+        limit = page_limit(request.args.get('limit'), default=50)
+        after = request.args.get('cursor')
+        
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        query = '''
             SELECT id, owner_id, name, slug, category, description, logo_url, cover_photo_url,
                    location, address, city, state, country, latitude, longitude, phone, email, website,
                    business_hours, rating, reviews_count, followers_count, product_count, total_sales,
                    is_verified, is_online_selling, is_offline_selling, accepts_online_payment, accepts_cash,
                    is_active, created_at, updated_at
-            FROM shops WHERE owner_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
-        shops = [dict(row) for row in cursor.fetchall()]
+            FROM shops WHERE owner_id = ?
+        '''
+        params = [user_id]
+        
+        if after:
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        shops, pagination = paginate(cursor.fetchall(), limit, 'created_at', 'id')
         conn.close()
         
-        return jsonify(standard_response('success', 'Shops retrieved', shops)), 200
+        return jsonify(standard_response('success', 'Shops retrieved', shops, pagination=pagination)), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
@@ -101,21 +116,36 @@ def get_user_shops():
 def get_user_events():
     try:
         user_id = int(get_jwt_identity())
+        limit = page_limit(request.args.get('limit'), default=50)
+        after = request.args.get('cursor')
+        
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        query = '''
             SELECT id, organizer_id, shop_id, title, slug, description, event_type, category,
                    start_date, end_date, location, venue_name, venue_address, venue_city, venue_state,
                    venue_country, latitude, longitude, meeting_url, max_attendees, ticket_price,
                    is_free, is_published, status, views_count, registrations_count, created_at, updated_at
-            FROM events WHERE organizer_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
-        events = [dict(row) for row in cursor.fetchall()]
+            FROM events WHERE organizer_id = ?
+        '''
+        params = [user_id]
+        
+        if after:
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend(decode_cursor(after, 2))
+        
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        events, pagination = paginate(cursor.fetchall(), limit, 'created_at', 'id')
         conn.close()
         
-        return jsonify(standard_response('success', 'Events retrieved', events)), 200
+        return jsonify(standard_response('success', 'Events retrieved', events, pagination=pagination)), 200
         
+    except ApiError as e:
+        return jsonify(standard_response('error', e.message)), e.status
     except Exception as e:
         return jsonify(standard_response('error', str(e))), 500
 
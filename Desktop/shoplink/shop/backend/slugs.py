@@ -0,0 +1,59 @@
+"""
+Slug allocation for shops, products and events.
+
+Instead of probing name, name-1, name-2, ... one query at a time, a single
+range read over the slug index finds whether the base slug is taken and
+the highest numeric suffix in use, and the next one is handed out. Slugs
+are unique per table (per shop for products) since migration 0011, so two
+writers that pick the same slug concurrently cannot both succeed; the loser
+gets an IntegrityError and write_with_slug retries with a fresh slug.
+"""
+import os
+import sqlite3
+
+from utils import generate_slug
+
+SLUG_MAX_ATTEMPTS = int(os.getenv('SLUG_MAX_ATTEMPTS', 5))
+
+# table: (base used when a name has no slug characters, column slugs are unique within)
+SLUG_TABLES = {
+    'shops': ('shop', None),
+    'products': ('product', 'shop_id'),
+    'events': ('event', None),
+}
+
+def allocate_slug(cursor, table, text, scope_id=None, exclude_id=None):
+    """Return the first free slug for ``text``: the base slug, or base-N past the highest N in use"""
+    fallback, scope = SLUG_TABLES[table]
+    base = generate_slug(text) or fallback
+    # Slugs only contain a-z, 0-9 and '-', so [base, base + '.') is exactly
+    # the base itself plus every base-... slug
+    query = f'''
+        SELECT MAX(slug = ?) AS taken,
+               MAX(CASE WHEN slug GLOB ? AND substr(slug, ?) NOT GLOB '*[^0-9]*'
+                        THEN CAST(substr(slug, ?) AS INTEGER) END) AS suffix
+        FROM {table} WHERE slug >= ? AND slug < ?
+    '''
+    # Only all-digit suffixes count: base-2024-sale is another slug, not base-2024
+    params = [base, f'{base}-[0-9]*', len(base) + 2, len(base) + 2, base, base + '.']
+    if scope:
+        query += f' AND {scope} = ?'
+        params.append(scope_id)
+    if exclude_id is not None:
+        query += ' AND id != ?'
+        params.append(exclude_id)
+    cursor.execute(query, params)
+    taken, suffix = cursor.fetchone()
+    if not taken:
+        return base
+    return f'{base}-{(suffix or 0) + 1}'
+
+def write_with_slug(cursor, table, text, write, scope_id=None, exclude_id=None):
+    """Call ``write(slug)`` with a freshly allocated slug, retrying if a concurrent writer took it"""
+    for attempt in range(SLUG_MAX_ATTEMPTS):
+        slug = allocate_slug(cursor, table, text, scope_id, exclude_id)
+        try:
+            return write(slug)
+        except sqlite3.IntegrityError as e:
+            if 'slug' not in str(e) or attempt == SLUG_MAX_ATTEMPTS - 1:
+                raise
@@ -1,4 +1,6 @@
+import base64
 import hashlib
+import json
 import secrets
 from werkzeug.security import generate_password_hash, check_password_hash
 import re
@@ -25,13 +27,66 @@ def generate_slug(text):
     slug = slug.strip('-')
     return slug
 
-def standard_response(status, message, data=None, timestamp=None):
+def standard_response(status, message, data=None, timestamp=None, pagination=None, summary=None):
     """Create a standardized API response"""
     from datetime import datetime
-    return {
+    response = {
         'status': status,
         'message': message,
         'data': data,
         'timestamp': timestamp or datetime.utcnow().isoformat()
     }
+    if pagination is not None:
+        response['pagination'] = pagination
+    if summary is not None:
+        response['summary'] = summary
+    return response
 
+def spliced_response(status, message, data_json, pagination=None, code=200):
+    """standard_response whose ``data`` is already serialized JSON (bytes), as a Flask response"""
+    from flask import current_app
+    envelope = current_app.json.dumps(standard_response(status, message, pagination=pagination),
+                                      separators=(',', ':'))
+    # Splice the cached bytes in place of "data":null instead of decoding and re-encoding them
+    head, _, tail = envelope.partition('"data":null')
+    body = head.encode() + b'"data":' + data_json + tail.encode()
+    return current_app.response_class(body, status=code, mimetype='application/json')
+
+
+class ApiError(Exception):
+    """Error carrying an HTTP status; raised inside write jobs to roll them back"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Decode a cursor from encode_cursor into its ``size`` sort key values"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ApiError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ApiError('Invalid cursor')
+    return values
+
+def page_limit(value, default=20, maximum=100):
+    """Parse a page size from the query string, clamped to 1..maximum"""
+    try:
+        limit = int(value) if value is not None else default
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+def paginate(rows, limit, *keys):
+    """Trim a LIMIT limit + 1 fetch to one page; returns (items, pagination)"""
+    items = [dict(row) for row in rows[:limit]]
+    has_more = len(rows) > limit
+    next_cursor = encode_cursor(*(items[-1][key] for key in keys)) if has_more else None
+    return items, {'limit': limit, 'next_cursor': next_cursor, 'has_more': has_more}
@@ -0,0 +1,186 @@
+"""
+Buffered page-view counters.
+
+Product and event GETs record a view here instead of writing to the
+database. Increments are summed per row in memory and applied as one
+batched job on the single writer every VIEW_FLUSH_SECONDS, or sooner once
+VIEW_FLUSH_THRESHOLD views are pending, so the read path never takes the
+write lock. Pending views are flushed on interpreter exit and on SIGTERM.
+views_count in the database may therefore lag by up to one flush interval.
+
+Each view is also appended to the view_events log with a pseudonymous
+viewer hash (salted per day, never the raw address); rollups.py compacts
+that log into hourly and daily tables, and the flush timer runs a rollup
+pass every VIEW_ROLLUP_SECONDS.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import signal
+import threading
+import time
+from collections import Counter
+
+from flask import has_request_context, request
+
+import rollups
+from writer import writer
+
+VIEW_FLUSH_SECONDS = float(os.getenv('VIEW_FLUSH_SECONDS', 10))
+VIEW_FLUSH_THRESHOLD = int(os.getenv('VIEW_FLUSH_THRESHOLD', 1000))
+VIEW_ROLLUP_SECONDS = float(os.getenv('VIEW_ROLLUP_SECONDS', 300))
+VIEW_HASH_SALT = os.getenv('VIEW_HASH_SALT', 'shoplink').encode()[:64]
+
+# Tables with a views_count column that can be counted, and their
+# entity_type in view_events
+TABLES = {'products': 'product', 'events': 'event'}
+
+logger = logging.getLogger(__name__)
+
+def viewer_hash():
+    """Pseudonymous id of the current visitor, stable for one UTC day"""
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    address = forwarded.split(',')[0].strip() or request.remote_addr or ''
+    day = time.strftime('%Y-%m-%d', time.gmtime())
+    digest = hashlib.blake2b(f'{day}|{address}|{request.user_agent.string}'.encode(),
+                             digest_size=8, key=VIEW_HASH_SALT).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def _apply(conn, deltas, events):
+    """Writer job: add the buffered deltas to views_count and append the view log"""
+    for table, counts in deltas.items():
+        conn.executemany(f'UPDATE {table} SET views_count = views_count + ? WHERE id = ?',
+                         [(count, row_id) for row_id, count in sorted(counts.items())])
+    conn.executemany('INSERT INTO view_events (entity_type, entity_id, viewed_at, viewer_hash) VALUES (?, ?, ?, ?)',
+                     events)
+
+class ViewCounter:
+    """Per-process view increments, flushed in batches through the writer"""
+
+    def __init__(self, flush_seconds=VIEW_FLUSH_SECONDS, flush_threshold=VIEW_FLUSH_THRESHOLD):
+        self.flush_seconds = flush_seconds
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._pid = None
+        self._timer = None
+        self._reset()
+
+    def _reset(self):
+        self._pending = {table: Counter() for table in TABLES}
+        self._events = []
+        self._pending_views = 0
+        self._last_rollup = time.monotonic()
+        self.views = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Views counted by the parent are flushed by the parent
+            self._pid = os.getpid()
+            self._reset()
+            self._timer = threading.Thread(target=self._tick, name='view-counter', daemon=True)
+            self._timer.start()
+
+    def _tick(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                if VIEW_ROLLUP_SECONDS and time.monotonic() - self._last_rollup >= VIEW_ROLLUP_SECONDS:
+                    self._last_rollup = time.monotonic()
+                    writer.submit(rollups.rollup)
+            except Exception as e:
+                logger.error('View counter flush failed: %s', e)
+
+    def add(self, table, row_id, count=1):
+        """Record ``count`` views of ``table`` row ``row_id``"""
+        viewer = viewer_hash() if has_request_context() else None
+        event = (TABLES[table], row_id, int(time.time()), viewer)
+        with self._lock:
+            self._check_fork()
+            self._pending[table][row_id] += count
+            self._events.extend([event] * count)
+            self._pending_views += count
+            self.views += count
+            due = self._pending_views >= self.flush_threshold
+        if due:
+            self.flush()
+
+    def flush(self, wait=False, timeout=None, blocking=True):
+        """Hand pending deltas to the writer; with ``wait``, block until committed.
+
+        With ``blocking=False`` nothing is flushed if the lock is held, e.g.
+        by an add() that a signal handler interrupted on the same thread.
+        """
+        if not self._lock.acquire(blocking):
+            return
+        try:
+            self._check_fork()
+            if not self._pending_views:
+                return
+            deltas = {table: counts for table, counts in self._pending.items() if counts}
+            events = self._events
+            self._pending = {table: Counter() for table in TABLES}
+            self._events = []
+            self._pending_views = 0
+            self.flushes += 1
+        finally:
+            self._lock.release()
+        future = writer.submit(_apply, deltas, events)
+        future.add_done_callback(lambda f: self._restore(deltas, events) if f.exception() else None)
+        if wait:
+            try:
+                future.result(timeout)
+            except Exception as e:
+                logger.error('View counter flush failed: %s', e)
+
+    def _restore(self, deltas, events):
+        # Keep the views of a failed flush for the next attempt
+        with self._lock:
+            self.failed_flushes += 1
+            self._events.extend(events)
+            for table, counts in deltas.items():
+                self._pending[table].update(counts)
+                self._pending_views += sum(counts.values())
+
+    def stats(self):
+        return {
+            'pending_views': self._pending_views,
+            'views': self.views,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+        }
+
+view_counter = ViewCounter()
+
+def _flush_at_exit(blocking=True):
+    if view_counter._pid == os.getpid():
+        view_counter.flush(wait=True, timeout=5, blocking=blocking)
+
+def _install_sigterm_handler():
+    """Flush on SIGTERM, then defer to whatever handler was installed before.
+
+    The handler runs on the main thread, possibly inside add() with the lock
+    held, so it never waits for the lock; whatever it cannot flush is left
+    to the atexit flush, which runs once the process exits normally.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        _flush_at_exit(blocking=False)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+def init_app(app):
+    """Register the shutdown flushes (atexit runs before the writer is closed)"""
+    atexit.register(_flush_at_exit)
+    _install_sigterm_handler()
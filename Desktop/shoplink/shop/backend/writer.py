@@ -0,0 +1,204 @@
+"""
+Single writer for the SQLite write path.
+
+Mutations are submitted as jobs (callables taking a connection) and executed
+by one background thread per process that owns a dedicated write connection.
+Jobs that arrive together are grouped into a single BEGIN IMMEDIATE ...
+COMMIT, each inside its own savepoint so one failing job does not undo the
+others. Acquiring the write lock is retried with exponential backoff when
+another process holds it (SQLITE_BUSY).
+
+Jobs must not call commit() or rollback() themselves; raise an exception
+(e.g. utils.ApiError) to roll back just that job.
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import has_request_context, request
+
+import database
+
+WRITER_BATCH_SIZE = int(os.getenv('WRITER_BATCH_SIZE', 64))
+WRITER_BATCH_WINDOW_MS = float(os.getenv('WRITER_BATCH_WINDOW_MS', 2))
+WRITER_MAX_RETRIES = int(os.getenv('WRITER_MAX_RETRIES', 8))
+WRITER_BACKOFF_MS = float(os.getenv('WRITER_BACKOFF_MS', 5))
+WRITER_MAX_BACKOFF_MS = float(os.getenv('WRITER_MAX_BACKOFF_MS', 500))
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+class SingleWriter:
+    """Serializes writes through one connection and group-commits them"""
+
+    def __init__(self, batch_size=WRITER_BATCH_SIZE, batch_window_ms=WRITER_BATCH_WINDOW_MS):
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = queue.Queue()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.busy_retries = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # First use in this process (or we were forked): start a fresh thread
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._reset_stats()
+            self._thread = threading.Thread(target=self._loop, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(conn, *args, **kwargs)`` and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        # Statements the job runs are attributed to the submitting endpoint
+        future.endpoint = request.endpoint if has_request_context() else None
+        future.query_scope = None
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Submit a job and block until it has been committed"""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        finally:
+            database.merge_query_scope(future.query_scope)
+
+    def close(self, timeout=5):
+        """Flush queued jobs and stop the writer thread"""
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'jobs': self.jobs,
+            'failed_jobs': self.failed_jobs,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'avg_batch_size': round(self.jobs / self.batches, 2) if self.batches else 0,
+            'busy_retries': self.busy_retries,
+            'lock_wait_ms_total': round(self.lock_wait_total * 1000, 3),
+            'lock_wait_ms_max': round(self.lock_wait_max * 1000, 3),
+        }
+
+    def _loop(self):
+        conn = database.connect()
+        conn.isolation_level = None  # transactions are managed explicitly below
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is _STOP:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit_batch(conn, batch)
+        conn.discard()
+
+    def _with_retry(self, conn, statement):
+        """Execute a lock-taking statement, backing off while the database is busy"""
+        for attempt in range(WRITER_MAX_RETRIES + 1):
+            try:
+                conn.execute(statement)
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == WRITER_MAX_RETRIES:
+                    raise
+                self.busy_retries += 1
+                delay = min(WRITER_BACKOFF_MS * (2 ** attempt), WRITER_MAX_BACKOFF_MS)
+                time.sleep(delay / 1000)
+
+    def _commit_batch(self, conn, batch):
+        started = time.perf_counter()
+        try:
+            self._with_retry(conn, 'BEGIN IMMEDIATE')
+        except sqlite3.Error as e:
+            self._fail_batch(batch, e)
+            return
+        waited = time.perf_counter() - started
+        self.lock_wait_total += waited
+        self.lock_wait_max = max(self.lock_wait_max, waited)
+
+        outcomes = []
+        for fn, args, kwargs, future in batch:
+            with database.query_scope(future.endpoint) as scope:
+                try:
+                    conn.execute('SAVEPOINT job')
+                    result = fn(conn, *args, **kwargs)
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK TO job')
+                        conn.execute('RELEASE job')
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute('RELEASE job')
+                    outcomes.append((future, result, None))
+            future.query_scope = scope
+
+        try:
+            if conn.in_transaction:
+                self._with_retry(conn, 'COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._fail_batch(batch, e)
+            return
+
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, result, error in outcomes:
+            if error is not None:
+                self.failed_jobs += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _fail_batch(self, batch, error):
+        logger.error('Write batch of %d job(s) failed: %s', len(batch), error)
+        self.batches += 1
+        self.failed_batches += 1
+        self.jobs += len(batch)
+        self.failed_jobs += len(batch)
+        for _, _, _, future in batch:
+            future.set_exception(error)
+
+writer = SingleWriter()
+atexit.register(writer.close)
@@ -13,6 +13,10 @@ pip install -r requirements.txt
 echo "🗄️  Initializing database..."
 python -c "from database import init_db; init_db()"
 
+# Fail the build if a route query lost its index
+echo "🔎 Checking route query plans..."
+python check_query_plans.py || exit 1
+
 echo "✅ Backend build complete!"
 
 # Frontend setup (if deploying together)
@@ -1,10 +1,56 @@
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000/api'
 
+export interface Pagination {
+  limit: number
+  next_cursor: string | null
+  has_more: boolean
+}
+
 export interface ApiResponse<T = any> {
   status: 'success' | 'error'
   message: string
   data?: T
   timestamp?: string
+  pagination?: Pagination
+  summary?: ReviewSummary
+}
+
+export type ReviewSort = 'newest' | 'highest' | 'lowest' | 'verified'
+
+export interface ReviewSummary {
+  rating: number
+  rating_count: number
+  distribution: Record<string, number>
+}
+
+export interface NearbyParams {
+  lat: number
+  lng: number
+  radius_km?: number
+  limit?: number
+  cursor?: string
+}
+
+function nearbyQuery(params: NearbyParams) {
+  const query = new URLSearchParams({ lat: params.lat.toString(), lng: params.lng.toString() })
+  if (params.radius_km) query.append('radius_km', params.radius_km.toString())
+  if (params.limit) query.append('limit', params.limit.toString())
+  if (params.cursor) query.append('cursor', params.cursor)
+  return query
+}
+
+export interface ReviewListParams {
+  sort?: ReviewSort
+  limit?: number
+  cursor?: string
+}
+
+function reviewQuery(params?: ReviewListParams) {
+  const query = new URLSearchParams()
+  if (params?.sort) query.append('sort', params.sort)
+  if (params?.limit) query.append('limit', params.limit.toString())
+  if (params?.cursor) query.append('cursor', params.cursor)
+  return query.toString()
 }
 
 class ApiClient {
@@ -78,12 +124,43 @@ class ApiClient {
     })
   }
 
-  async getUserShops() {
-    return this.request('/users/shops')
+  async getUserShops(params?: { limit?: number; cursor?: string }) {
+    const query = new URLSearchParams()
+    if (params?.limit) query.append('limit', params.limit.toString())
+    if (params?.cursor) query.append('cursor', params.cursor)
+    return this.request(`/users/shops?${query.toString()}`)
   }
 
-  async getUserEvents() {
-    return this.request('/users/events')
+  async getUserEvents(params?: { limit?: number; cursor?: string }) {
+    const query = new URLSearchParams()
+    if (params?.limit) query.append('limit', params.limit.toString())
+    if (params?.cursor) query.append('cursor', params.cursor)
+    return this.request(`/users/events?${query.toString()}`)
+  }
+
+  // Every shop / event of the current user, across all pages
+  async getAllUserShops() {
+    return this.collectPages((cursor) => this.getUserShops({ limit: 100, cursor }))
+  }
+
+  async getAllUserEvents() {
+    return this.collectPages((cursor) => this.getUserEvents({ limit: 100, cursor }))
+  }
+
+  // Call fetchPage with each next_cursor in turn and concatenate the pages;
+  // throws if a page fails so callers never mistake a partial list for the full one
+  private async collectPages(fetchPage: (cursor?: string) => Promise<ApiResponse>) {
+    const items: any[] = []
+    let cursor: string | undefined
+    do {
+      const response = await fetchPage(cursor)
+      if (response.status !== 'success' || !response.data) {
+        throw new Error(response.message || 'Failed to load all pages')
+      }
+      items.push(...response.data)
+      cursor = response.pagination?.next_cursor || undefined
+    } while (cursor)
+    return items
   }
 
   // Shops
@@ -98,14 +175,22 @@ class ApiClient {
     return this.request(`/shops/${id}`)
   }
 
-  async listShops(params?: { category?: string; limit?: number; offset?: number }) {
+  async listShops(params?: { category?: string; limit?: number; offset?: number; cursor?: string }) {
     const query = new URLSearchParams()
     if (params?.category) query.append('category', params.category)
     if (params?.limit) query.append('limit', params.limit.toString())
     if (params?.offset) query.append('offset', params.offset.toString())
+    if (params?.cursor) query.append('cursor', params.cursor)
     return this.request(`/shops?${query.toString()}`)
   }
 
+  // Closest first; each shop carries distance_km
+  async nearbyShops(params: NearbyParams & { category?: string }) {
+    const query = nearbyQuery(params)
+    if (params.category) query.append('category', params.category)
+    return this.request(`/shops/nearby?${query.toString()}`)
+  }
+
   async updateShop(id: number, data: any) {
     return this.request(`/shops/${id}`, {
       method: 'PUT',
@@ -137,8 +222,16 @@ class ApiClient {
     return response.json()
   }
 
-  async getShopProducts(shopId: number) {
-    return this.request(`/shops/${shopId}/products`)
+  async getShopProducts(shopId: number, params?: { limit?: number; cursor?: string }) {
+    const query = new URLSearchParams()
+    if (params?.limit) query.append('limit', params.limit.toString())
+    if (params?.cursor) query.append('cursor', params.cursor)
+    return this.request(`/shops/${shopId}/products?${query.toString()}`)
+  }
+
+  // Follow next_cursor until every page of a shop's products is loaded
+  async getAllShopProducts(shopId: number) {
+    return this.collectPages((cursor) => this.getShopProducts(shopId, { limit: 100, cursor }))
   }
 
   // Products
@@ -153,6 +246,25 @@ class ApiClient {
     return this.request(`/products/${id}`)
   }
 
+  async searchProducts(params: {
+    q: string
+    min_price?: number
+    max_price?: number
+    in_stock?: boolean
+    shop_id?: number
+    limit?: number
+    cursor?: string
+  }) {
+    const query = new URLSearchParams({ q: params.q })
+    if (params.min_price !== undefined) query.append('min_price', params.min_price.toString())
+    if (params.max_price !== undefined) query.append('max_price', params.max_price.toString())
+    if (params.in_stock) query.append('in_stock', '1')
+    if (params.shop_id) query.append('shop_id', params.shop_id.toString())
+    if (params.limit) query.append('limit', params.limit.toString())
+    if (params.cursor) query.append('cursor', params.cursor)
+    return this.request(`/products/search?${query.toString()}`)
+  }
+
   async updateProduct(id: number, data: any) {
     return this.request(`/products/${id}`, {
       method: 'PUT',
@@ -190,15 +302,20 @@ class ApiClient {
     return this.request(`/events/${id}`)
   }
 
-  async listEvents(params?: { status?: string; is_published?: boolean; limit?: number; offset?: number }) {
+  async listEvents(params?: { status?: string; is_published?: boolean; limit?: number; offset?: number; cursor?: string }) {
     const query = new URLSearchParams()
     if (params?.status) query.append('status', params.status)
     if (params?.is_published !== undefined) query.append('is_published', params.is_published.toString())
     if (params?.limit) query.append('limit', params.limit.toString())
     if (params?.offset) query.append('offset', params.offset.toString())
+    if (params?.cursor) query.append('cursor', params.cursor)
     return this.request(`/events?${query.toString()}`)
   }
 
+  async nearbyEvents(params: NearbyParams) {
+    return this.request(`/events/nearby?${nearbyQuery(params).toString()}`)
+  }
+
   async updateEvent(id: number, data: any) {
     return this.request(`/events/${id}`, {
       method: 'PUT',
@@ -251,6 +368,13 @@ class ApiClient {
     })
   }
 
+  async checkout(data: { payment_method: string; shipping_address: string }) {
+    return this.request('/orders/checkout', {
+      method: 'POST',
+      body: JSON.stringify(data),
+    })
+  }
+
   async getOrders(shopId?: number) {
     const query = shopId ? `?shop_id=${shopId}` : ''
     return this.request(`/orders${query}`)
@@ -268,8 +392,13 @@ class ApiClient {
     })
   }
 
-  async getShopReviews(shopId: number) {
-    return this.request(`/reviews/shop/${shopId}`)
+  // The first page (no cursor) also carries the rating summary
+  async getShopReviews(shopId: number, params?: ReviewListParams) {
+    return this.request(`/reviews/shop/${shopId}?${reviewQuery(params)}`)
+  }
+
+  async getShopReviewSummary(shopId: number) {
+    return this.request(`/reviews/shop/${shopId}/summary`)
   }
 
   async createProductReview(productId: number, data: any) {
@@ -279,8 +408,19 @@ class ApiClient {
     })
   }
 
-  async getProductReviews(productId: number) {
-    return this.request(`/reviews/product/${productId}`)
+  async getProductReviews(productId: number, params?: ReviewListParams) {
+    return this.request(`/reviews/product/${productId}?${reviewQuery(params)}`)
+  }
+
+  async getProductReviewSummary(productId: number) {
+    return this.request(`/reviews/product/${productId}/summary`)
+  }
+
+  // Map
+  async getMapClusters(params: { kind?: 'shops' | 'events'; zoom: number; bbox: [number, number, number, number] }) {
+    const query = new URLSearchParams({ zoom: params.zoom.toString(), bbox: params.bbox.join(',') })
+    if (params.kind) query.append('kind', params.kind)
+    return this.request(`/map/clusters?${query.toString()}`)
   }
 
   // Followers
@@ -178,31 +178,17 @@ const Checkout = () => {
 
     setProcessing(true)
     try {
-      const groupedItems = groupItemsByShop()
-      const orderPromises = Object.entries(groupedItems).map(async ([shopId, items]) => {
-        const orderData = {
-          shop_id: parseInt(shopId),
-          items: items.map((item) => ({
-            product_id: item.product_id,
-            quantity: item.quantity,
-          })),
-          payment_method: paymentMethod,
-          shipping_address: `${shippingAddress.full_name}\n${shippingAddress.address}\n${shippingAddress.city}, ${shippingAddress.state} ${shippingAddress.zip_code}\n${shippingAddress.country}\nPhone: ${shippingAddress.phone}`,
-        }
-
-        return api.createOrder(orderData)
+      // One request creates an order per shop and empties the cart
+      const result = await api.checkout({
+        payment_method: paymentMethod,
+        shipping_address: `${shippingAddress.full_name}\n${shippingAddress.address}\n${shippingAddress.city}, ${shippingAddress.state} ${shippingAddress.zip_code}\n${shippingAddress.country}\nPhone: ${shippingAddress.phone}`,
       })
 
-      const results = await Promise.all(orderPromises)
-      const allSuccess = results.every((result) => result.status === 'success')
-
-      if (allSuccess) {
-        // Clear cart
-        await api.clearCart()
+      if (result.status === 'success') {
         // Navigate to success page or profile
         navigate('/profile?tab=orders&success=true')
       } else {
-        alert('Some orders failed to process. Please try again.')
+        alert(result.message || 'Failed to place order. Please try again.')
       }
     } catch (error) {
       console.error('Failed to place order:', error)
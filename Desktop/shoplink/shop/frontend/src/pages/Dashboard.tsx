@@ -57,27 +57,20 @@ const Dashboard = () => {
   const loadData = async () => {
     setLoading(true)
     try {
-      const [shopsRes, eventsRes] = await Promise.all([
-        api.getUserShops(),
-        api.getUserEvents(),
+      // Both lists are cursor-paginated; follow every page so no shop or event is left out
+      const [userShops, userEvents] = await Promise.all([
+        api.getAllUserShops(),
+        api.getAllUserEvents(),
       ])
 
-      if (shopsRes.status === 'success' && shopsRes.data) {
-        setShops(shopsRes.data)
-        // Load products for all shops
-        const allProducts: Product[] = []
-        for (const shop of shopsRes.data) {
-          const productsRes = await api.getShopProducts(shop.id)
-          if (productsRes.status === 'success' && productsRes.data) {
-            allProducts.push(...productsRes.data)
-          }
-        }
-        setProducts(allProducts)
-      }
-
-      if (eventsRes.status === 'success' && eventsRes.data) {
-        setEvents(eventsRes.data)
+      setShops(userShops)
+      // Load products for all shops
+      const allProducts: Product[] = []
+      for (const shop of userShops) {
+        allProducts.push(...(await api.getAllShopProducts(shop.id)))
       }
+      setProducts(allProducts)
+      setEvents(userEvents)
     } catch (error) {
       console.error('Failed to load data:', error)
     } finally {
@@ -41,6 +41,7 @@ const ShopDetail = () => {
   const { isAuthenticated } = useAuth()
   const [shop, setShop] = useState<Shop | null>(null)
   const [products, setProducts] = useState<Product[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [loading, setLoading] = useState(true)
   const [isFollowing, setIsFollowing] = useState(false)
   const [followLoading, setFollowLoading] = useState(false)
@@ -69,12 +70,13 @@ const ShopDetail = () => {
     }
   }
 
-  const loadProducts = async () => {
+  const loadProducts = async (cursor?: string) => {
     if (!id) return
     try {
-      const response = await api.getShopProducts(parseInt(id))
+      const response = await api.getShopProducts(parseInt(id), { cursor })
       if (response.status === 'success' && response.data) {
-        setProducts(response.data)
+        setProducts(cursor ? [...products, ...response.data] : response.data)
+        setNextCursor(response.pagination?.next_cursor || null)
       }
     } catch (error) {
       console.error('Failed to load products:', error)
@@ -253,7 +255,7 @@ const ShopDetail = () => {
 
       {/* Products */}
       <div className="mb-6">
-        <h2 className="text-2xl font-semibold mb-4">Products ({products.length})</h2>
+        <h2 className="text-2xl font-semibold mb-4">Products ({shop.product_count})</h2>
         {products.length === 0 ? (
           <div className="bg-white rounded-lg shadow p-12 text-center">
             <p className="text-gray-500">No products available yet.</p>
@@ -301,6 +303,16 @@ const ShopDetail = () => {
             ))}
           </div>
         )}
+        {nextCursor && (
+          <div className="mt-6 text-center">
+            <button
+              onClick={() => loadProducts(nextCursor)}
+              className="bg-gray-200 hover:bg-gray-300 text-gray-700 px-6 py-2 rounded-md"
+            >
+              Load more
+            </button>
+          </div>
+        )}
       </div>
     </div>
   )